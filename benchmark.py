@@ -0,0 +1,280 @@
+# Program:
+# benchmark.py
+# Snake Autopilot Microbenchmarks
+#
+# Description:
+# This python program times the autopilot's building blocks against a fixed corpus of board positions so
+# every performance change to the planner is measured against the same boards. Each benchmark reports
+# operations per second (best of several repeats) and the peak memory allocated by a single operation,
+# then compares against a saved baseline. Ops/sec are machine dependent, so save a baseline on the machine
+# the comparison runs on before making a change.
+#
+# Positions (benchmark_positions.json):
+# - early:    Short snake in open board
+# - midCoil:  Length ~100 snake coiling in a corner because the path to food is not safe
+# - trapped:  Snake with no proven safe move, falling back to the free space guessing coil
+# - nearWin:  Length 244 snake on a Hamiltonian cycle with 12 free tiles left
+#
+# Usage:
+# - python benchmark.py                  Run and compare against benchmark_baseline.json
+# - python benchmark.py --save           Run and save results as the new baseline
+# - python benchmark.py --build-corpus   Regenerate benchmark_positions.json from seeded games
+# - python benchmark.py --backend python Time the pure Python searches even when the kernel is built
+# - python benchmark.py --parity         Check the compiled kernel (build_kernel.py) against pure Python
+#
+# Parity:
+# Compares both search backends on random boards, then plays seeded classic and scenario games with each and
+# compares every move, method and search count. Exits 1 on any difference.
+
+
+# -------- Imports -------- #
+import argparse
+import contextlib
+import glob
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import snake
+
+POSITIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_positions.json')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+SCENARIO_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios', '*.json')
+MIN_TIME = 0.2  # Minimum time per repeat (s)
+REPEATS = 3  # Repeats per benchmark, best is reported
+
+
+def getCell(tile):  # Grid [column, row] of a tile
+    return [tile.x // snake.GRID_SIZE, tile.y // snake.GRID_SIZE]
+
+
+def getTile(game, cell):  # Tile of a grid [column, row]
+    return game.Tiles[cell[0] * (game.canvasHeight // snake.GRID_SIZE) + cell[1]]
+
+
+def getPosition(game):
+    return {'snake': [getCell(tile) for tile in game.snake[0]], 'food': getCell(game.foods[0]),
+            'snakeLength': game.snakeLength}
+
+
+def loadPosition(game, position):
+    game.setPosition([getTile(game, cell) for cell in position['snake']], [getTile(game, position['food'])],
+                     position['snakeLength'])
+
+
+def buildCorpus():
+    positions = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for seed in [1, 2]:
+            game = snake.clsGame(seed)
+            game.finishSetup()
+            game.reset()
+            while game.outcome is None:
+                position = getPosition(game)
+                frame = game.step()
+                method = frame['message'][0] if frame['message'] is not None else None
+                if seed == 1 and game.iteration == 30:
+                    positions['early'] = position
+                if seed == 2 and 'midCoil' not in positions and position['snakeLength'] >= 100 \
+                        and method == 'Coil in Corner - Recursive':
+                    positions['midCoil'] = position
+                if seed == 2 and 'trapped' not in positions and position['snakeLength'] >= 150 \
+                        and method == 'Corner coil while preserving max space':
+                    positions['trapped'] = position
+
+    # Hamiltonian cycle: row 0 left to right, rows 1-15 snaking through columns 1-15, back down column 0
+    cycle = [[column, 0] for column in range(16)]
+    for row in range(1, 16):
+        columns = range(15, 0, -1) if row % 2 else range(1, 16)
+        cycle.extend([column, row] for column in columns)
+    cycle.extend([0, row] for row in range(15, 0, -1))
+    positions['nearWin'] = {'snake': list(reversed(cycle[:244])), 'food': cycle[250], 'snakeLength': 244}
+
+    with open(POSITIONS_FILE, 'w') as f:
+        f.write('{\n%s\n}\n' % ',\n'.join('"%s": %s' % (name, json.dumps(position))
+                                           for name, position in positions.items()))
+    print('Saved %i positions to %s' % (len(positions), POSITIONS_FILE))
+
+
+def getBenchmarks(game):  # Dict of benchmark name and operation, run against the loaded position
+    def pathToFood():
+        game.pathfind.solve(game.snake[0][0], game.foods[0], 0, snake.PATH_TO_FOOD)
+
+    def pathToTail():
+        game.pathfind.solve(game.snake[0][0], game.snake[0][-1], 0, snake.PATH_TO_TAIL)
+
+    def freeSpace():
+        game.freeSpace.solve(game.snake[0][0], 0)
+
+    def generateBoard():
+        game.generateBoard(9, game.snake[0].copy())
+
+    def evaluateSafety():
+        snake.evaluateSafety.__wrapped__(game.getBoardSnapshot(0))  # Bypass cache
+
+    def planMove():
+        snake.evaluateSafety.cache_clear()  # Every decision starts cold, as a new position would
+        game.planMove()
+
+    return {'pathfind.food': pathToFood, 'pathfind.tail': pathToTail, 'freeSpace': freeSpace,
+            'generateBoard': generateBoard, 'evaluateSafety': evaluateSafety, 'planMove': planMove}
+
+
+def timeOperation(operation):  # Return best ops/sec over REPEATS
+    best = 0
+    for _ in range(REPEATS):
+        count = 0
+        start = time.perf_counter()
+        while True:
+            operation()
+            count += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_TIME:
+                break
+        best = max(best, count / elapsed)
+    return best
+
+
+def measureAllocation(operation):  # Return peak bytes allocated by one operation
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - before
+
+
+def runBenchmarks(names=None):
+    with open(POSITIONS_FILE) as f:
+        positions = json.load(f)
+    game = snake.clsGame(0)
+    game.finishSetup()
+    results = {}
+    with open(os.devnull, 'w') as devnull:
+        for positionName, position in positions.items():
+            loadPosition(game, position)
+            for benchName, operation in getBenchmarks(game).items():
+                if names and benchName not in names:
+                    continue
+                with contextlib.redirect_stdout(devnull):
+                    opsPerSec = timeOperation(operation)
+                    peakBytes = measureAllocation(operation)
+                results['%s/%s' % (benchName, positionName)] = {'opsPerSec': round(opsPerSec, 1),
+                                                                'peakBytes': peakBytes}
+                print('.', end='', flush=True)
+    print()
+    return results
+
+
+def playTicks(seed, scenario):  # (move, method, length, search nodes) of every step of a seeded game
+    game = snake.clsGame(seed, scenario=scenario, verbose=False)
+    game.finishSetup()
+    game.reset()
+    return [(event.move, event.method, event.length, event.searchNodes) for event in game.ticks()]
+
+
+def checkParity(seeds, boards):  # Compare kernel and pure Python backends, return count of mismatches
+    if not snake.useKernel(True):
+        print('Kernel not built, run python build_kernel.py first')
+        return 1
+    mismatches = 0
+
+    # Random boards, with FREE heads and tails as board 0 can have
+    rng = random.Random(0)
+    for i in range(boards):
+        density = rng.random()
+        blocked = bytes(rng.random() < density for _ in range(256))
+        snapshot = snake.clsBoardSnapshot(16, 16, blocked, (rng.randrange(256), rng.randrange(256)),
+                                          rng.randint(2, 256), snake.DEFAULT_POLICY['freeSpaceFactor'])
+        results = []
+        for enabled in [True, False]:
+            snake.useKernel(enabled)
+            results.append((snake.evaluateSafety(snapshot), snake.countFreeSpace(snapshot)))
+        if results[0] != results[1]:
+            print('Board %i: kernel %s, python %s' % (i, results[0], results[1]))
+            mismatches += 1
+    print('%i random boards' % boards)
+
+    # Seeded games, every decision and search count must match
+    for scenarioFile in [None] + sorted(glob.glob(SCENARIO_FILES)):
+        scenario = snake.loadScenario(scenarioFile) if scenarioFile else None
+        for seed in seeds:
+            ticks = []
+            for enabled in [True, False]:
+                snake.useKernel(enabled)
+                start = time.perf_counter()
+                ticks.append(playTicks(seed, scenario))
+                ticks[-1].append(time.perf_counter() - start)
+            kernelTime, pythonTime = ticks[0].pop(), ticks[1].pop()
+            name = '%s seed %i' % (scenario['name'] if scenario else 'classic', seed)
+            if ticks[0] != ticks[1]:
+                step = next((i for i, (a, b) in enumerate(zip(*ticks)) if a != b), min(map(len, ticks)))
+                print('%-20s differs at step %i' % (name, step))
+                mismatches += 1
+            else:
+                print('%-20s %5i moves   kernel %5.1fs   python %5.1fs' % (name, len(ticks[0]), kernelTime,
+                                                                          pythonTime))
+    snake.useKernel(True)
+    return mismatches
+
+
+def report(results, baseline, threshold):  # Print results against baseline, return count of regressions
+    regressions = 0
+    print('%-30s %12s %12s %8s %12s' % ('Benchmark', 'ops/sec', 'baseline', 'ratio', 'peak KB'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print('%-30s %12.1f %12s %8s %12.1f' % (name, result['opsPerSec'], '-', '-',
+                                                     result['peakBytes'] / 1024))
+            continue
+        ratio = result['opsPerSec'] / base['opsPerSec']
+        flag = ''
+        if ratio < threshold:
+            flag = '  <-- slower'
+            regressions += 1
+        print('%-30s %12.1f %12.1f %7.2fx %12.1f%s' % (name, result['opsPerSec'], base['opsPerSec'], ratio,
+                                                      result['peakBytes'] / 1024, flag))
+    return regressions
+
+
+# -------- Main -------- #
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the snake autopilot against fixed positions')
+    parser.add_argument('--save', action='store_true', help='Save results as the new baseline')
+    parser.add_argument('--build-corpus', action='store_true', help='Regenerate the position corpus')
+    parser.add_argument('--threshold', type=float, default=0.8,
+                        help='Ratio to baseline below which a benchmark counts as a regression')
+    parser.add_argument('--backend', choices=['kernel', 'python'], default='kernel',
+                        help='Search backend to time, kernel falls back to python when it is not built')
+    parser.add_argument('--parity', action='store_true', help='Check kernel and python backends agree')
+    parser.add_argument('--seeds', type=int, default=3, help='Seeded games per board for --parity')
+    parser.add_argument('benchmarks', nargs='*', help='Only run these benchmarks, e.g. planMove')
+    args = parser.parse_args()
+
+    if args.build_corpus:
+        buildCorpus()
+        sys.exit(0)
+
+    if args.parity:
+        mismatches = checkParity(range(args.seeds), 2000)
+        print('%i mismatches' % mismatches)
+        sys.exit(1 if mismatches else 0)
+
+    snake.useKernel(args.backend == 'kernel')
+    print('Search backend: %s' % snake.getBackend())
+    results = runBenchmarks(args.benchmarks)
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.threshold)
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('Saved baseline to %s' % BASELINE_FILE)
+    sys.exit(1 if regressions and not args.save else 0)
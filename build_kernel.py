@@ -0,0 +1,61 @@
+# Program:
+# build_kernel.py
+# Snake Autopilot Search Kernel Builder
+#
+# Description:
+# This python program compiles snake_kernel.c with the local C compiler into snake_kernel.so (snake_kernel.dll
+# on Windows) next to snake.py. snake.py loads the library through ctypes when it is there and uses it for the
+# evaluator flood fill, the free space count and the path to food search. Without it, or with
+# SNAKE_KERNEL=python set, the same searches run in pure Python with identical results.
+#
+# Usage:
+# - python build_kernel.py                Build with cc, or the compiler in the CC environment variable
+# - python build_kernel.py --cc gcc       Build with the given compiler
+# - python benchmark.py --parity          Check both backends make the same decisions
+
+
+# -------- Imports -------- #
+import argparse
+import os
+import shlex
+import subprocess
+import sys
+os.environ['SNAKE_KERNEL'] = 'python'  # Only KERNEL_FILE is needed here, an older build must not be loaded
+import snake
+
+SOURCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snake_kernel.c')
+
+
+def checkKernel():  # Load the new build in a fresh process, this one may hold an older build of the same path
+    environment = dict(os.environ)
+    del environment['SNAKE_KERNEL']
+    command = [sys.executable, '-c', 'import sys, snake; sys.exit(snake.getBackend() != "kernel")']
+    return subprocess.run(command, cwd=os.path.dirname(SOURCE_FILE), env=environment).returncode == 0
+
+
+def buildKernel(compiler):  # Compile SOURCE_FILE to snake.KERNEL_FILE, return True on success
+    command = shlex.split(compiler) + ['-O2', '-shared', '-o', snake.KERNEL_FILE, SOURCE_FILE]
+    if sys.platform != 'win32':
+        command.insert(-3, '-fPIC')
+    print(' '.join(command))
+    try:
+        subprocess.run(command, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print('Build failed, snake.py keeps using pure Python search: %s' % e)
+        return False
+    return True
+
+
+# -------- Main -------- #
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the optional snake autopilot search kernel')
+    parser.add_argument('--cc', default=os.environ.get('CC', 'cc'), help='C compiler command')
+    args = parser.parse_args()
+
+    if not buildKernel(args.cc):
+        sys.exit(1)
+    if not checkKernel():
+        print('Built %s but it could not be loaded' % snake.KERNEL_FILE)
+        sys.exit(1)
+    print('Built %s' % snake.KERNEL_FILE)
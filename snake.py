@@ -32,16 +32,51 @@
 #   - Coil towards closest prioritized corner (See above).
 # - If snake length == 256:
 #   - Win!
+#
+# Scenarios:
+# A scenario is a JSON file with a 16 x 16 map of walls and food plus the number of food items to keep on the
+# board, see scenarios/. With several food items the path to food search reaches all of them in one search
+# and the autopilot takes the nearest one that is safe. The snake wins by filling every tile that is not wall.
+# - python snake.py                          Classic empty board with one food
+# - python snake.py scenarios/rooms.json     Play a scenario
+#
+# Saved games:
+# clsGame.saveState captures a game in progress as a clsGameState, and restoreState puts any game on the same
+# board back in that exact position, optionally reseeding food so every restore plays a different variation.
+# packState and unpackState turn a state into a few KB of bytes for saving to disk.
+# - python snake.py --state late.state       Start the GUI from a saved game, Reset returns to it
+#
+# Events:
+# Every step emits a clsTickEvent (move, method, length, latency, search counts) to the game's listeners, see
+# clsGame.addListener and clsGame.ticks. clsEventWriter batches them to a newline delimited JSON file or socket.
+# - python snake.py --quiet --events ticks.ndjson
+# - python snake.py --quiet --events-socket 127.0.0.1:9000
+#
+# Search kernel:
+# The evaluator flood fill, free space count and path to food search have a compiled C version in
+# snake_kernel.c, used automatically once built and identical in every decision to the pure Python searches.
+# - python build_kernel.py                   Build snake_kernel.so next to this file
+# - python benchmark.py --parity             Check both backends play the same games
 
 
 # -------- Imports -------- #
-from tkinter import Tk, Canvas, Label, Button, Frame, StringVar, N, W, S, E, CENTER
+# Only the standard library is imported here so headless games start fast on any platform. Tk and the
+# monitor detection are imported by clsMainApp once a window is made.
 import datetime
-from win32api import GetSystemMetrics  # Used to detect monitor setup
 import time
 import math
 import random
 import logging
+import queue
+import threading
+import collections
+import ctypes
+import functools
+import json
+import os
+import socket
+import struct
+import sys
 
 RUNNING = 'running'  # Game is running
 STOPPED = 'stopped'  # Game is stopped
@@ -72,6 +107,9 @@ PATH = 'path'
 NO_PATH = 'noPath'
 PASS = 'pass'
 FAILED = 'failed'
+FOOD_PATH = 'foodPath'  # Move method, path to food was safe
+RECURSIVE_COIL = 'recursiveCoil'  # Move method, corner coil checked safe lookaheadDepth moves ahead
+GUESSING_COIL = 'guessingCoil'  # Move method, no safe move found, corner coil preserving max free space
 GRID_SIZE = 25
 S = 'S'  # Object sizes on grid
 M = 'M'
@@ -201,94 +239,371 @@ SHAPE_LIBRARY = {
 }
 
 
+# Planner policy, the thresholds the autopilot's decisions hinge on. See tune.py for sweeping them.
+DEFAULT_POLICY = {
+    'freeSpaceFactor': 1.5,  # Free space needed to be safe, as a multiple of snake length
+    'guessSpaceRatio': 0.8,  # Share of best free space a guessing corner coil move must preserve
+    'lookaheadDepth': 8,  # Moves checked ahead by recursivePrioritizedNeighborsCheck
+    'skipAheadLength': 60  # Length added by skipAhead
+}
+
+
+def checkPolicy(policy):  # Raise ValueError unless every setting of a full policy dict is known and in range
+    unknown = set(policy) - set(DEFAULT_POLICY)
+    if unknown:
+        raise ValueError('Unknown policy setting %s, expected one of %s'
+                         % (', '.join(sorted(unknown)), ', '.join(DEFAULT_POLICY)))
+    if not policy['freeSpaceFactor'] > 0:
+        raise ValueError('freeSpaceFactor must be above 0, got %s' % policy['freeSpaceFactor'])
+    if not 0 <= policy['guessSpaceRatio'] <= 1:
+        raise ValueError('guessSpaceRatio must be between 0 and 1, got %s' % policy['guessSpaceRatio'])
+    if not isinstance(policy['lookaheadDepth'], int) or policy['lookaheadDepth'] < 1:
+        raise ValueError('lookaheadDepth must be a whole number of at least 1, got %s' % policy['lookaheadDepth'])
+    if not isinstance(policy['skipAheadLength'], int) or policy['skipAheadLength'] < 0:
+        raise ValueError('skipAheadLength must be a whole number of at least 0, got %s' % policy['skipAheadLength'])
+
+
 # Logger
 _LOGGER = logging.getLogger(__name__)
 # logging.basicConfig(level=logging.DEBUG)  # Print debug and higher
 # logging.basicConfig(level=logging.ERROR)  # Print debug and higher
 
 
+def loadScenario(path):  # Read a scenario file to dict of wall cells, food cells and foodCount
+    # Map rows are listed top first, '#' is a wall, '*' is a food, '.' is free
+    with open(path) as f:
+        data = json.load(f)
+    walls, foods = [], []
+    for line, text in enumerate(data['map']):
+        for column, char in enumerate(text):
+            cell = (column, len(data['map']) - 1 - line)  # Row 0 is the bottom row
+            if char == '#':
+                walls.append(cell)
+            elif char == '*':
+                foods.append(cell)
+            elif char != '.':
+                raise ValueError('Invalid map character %r in %s' % (char, path))
+    return {
+        'name': data.get('name', path),
+        'columns': max(len(text) for text in data['map']),
+        'rows': len(data['map']),
+        'walls': walls,
+        'foods': foods,
+        'foodCount': max(data.get('foodCount', 1), len(foods))  # Food items kept on the board
+    }
+
+
+# Immutable copy of one board for evaluateSafety. Cells are numbered like Tiles, column * rows + row.
+# blocked holds 1 for every cell that is not FREE and snake holds the snake's cells, head first.
+clsBoardSnapshot = collections.namedtuple('clsBoardSnapshot', ['columns', 'rows', 'blocked', 'snake', 'snakeLength',
+                                                              'freeSpaceFactor'])
+
+
+# Everything needed to resume a game exactly. snake and foods hold cell indexes, states holds the board 0 state
+# of every cell as an index into STATE_CODES, and rngState is random.getstate() of the game's food sequence.
+clsGameState = collections.namedtuple('clsGameState', ['iteration', 'snakeLength', 'snake', 'foods', 'states',
+                                                      'rngState', 'outcome'])
+STATE_CODES = (FREE, SNAKE, WALL)  # Board 0 tile states in a clsGameState
+OUTCOME_CODES = (None, 'Win!', 'Game Over!')  # Outcomes in a packed clsGameState
+STATE_HEADER = struct.Struct('<4sIHBHHH')  # Magic, iteration, snakeLength, outcome, snake, foods and cell counts
+STATE_RNG_SIZE = len(random.Random().getstate()[1])  # Mersenne Twister state words in a packed clsGameState
+
+
+def packState(state):  # Compact bytes of a clsGameState
+    version, internalState, gaussNext = state.rngState
+    return b''.join([
+        STATE_HEADER.pack(b'SNK1', state.iteration, state.snakeLength, OUTCOME_CODES.index(state.outcome),
+                          len(state.snake), len(state.foods), len(state.states)),
+        struct.pack('<%iH' % len(state.snake), *state.snake),
+        struct.pack('<%iH' % len(state.foods), *state.foods),
+        state.states,
+        struct.pack('<B%iI' % len(internalState), version, *internalState),
+        struct.pack('<?d', gaussNext is not None, gaussNext or 0.0)
+    ])
+
+
+def unpackState(data):  # clsGameState from packState bytes, ValueError if they are not a whole saved game
+    if len(data) < STATE_HEADER.size:
+        raise ValueError('Not a saved snake game')
+    magic, iteration, snakeLength, outcome, snakeCount, foodCount, cellCount = STATE_HEADER.unpack_from(data)
+    if magic != b'SNK1':
+        raise ValueError('Not a saved snake game')
+    rngBytes = len(data) - STATE_HEADER.size - 2 * snakeCount - 2 * foodCount - cellCount - 1 - 9
+    if rngBytes != 4 * STATE_RNG_SIZE or outcome >= len(OUTCOME_CODES):
+        raise ValueError('Saved snake game is truncated or corrupt')
+    offset = STATE_HEADER.size
+    snake = struct.unpack_from('<%iH' % snakeCount, data, offset)
+    offset += 2 * snakeCount
+    foods = struct.unpack_from('<%iH' % foodCount, data, offset)
+    offset += 2 * foodCount
+    states = data[offset:offset + cellCount]
+    offset += cellCount
+    rngCount = rngBytes // 4  # Rest is version byte, internal state and gauss flag + double
+    rngValues = struct.unpack_from('<B%iI' % rngCount, data, offset)
+    hasGauss, gaussNext = struct.unpack_from('<?d', data, offset + 1 + 4 * rngCount)
+    return clsGameState(iteration, snakeLength, snake, foods, bytes(states),
+                        (rngValues[0], rngValues[1:], gaussNext if hasGauss else None), OUTCOME_CODES[outcome])
+
+
+# One record per game tick, emitted by clsGame.step to its listeners. move is the [column, row] the head moved
+# to, None when there was no move left. searchNodes counts the cells taken from the frontier by every search
+# behind the move, path to food, free space and safety alike, a cached evaluateSafety result counting the search
+# that produced it. safetyChecks counts safety checks. Both are 0 when the move came from the speculative cache.
+clsTickEvent = collections.namedtuple('clsTickEvent', ['iteration', 'move', 'method', 'length', 'latencyMs',
+                                                      'searchNodes', 'safetyChecks', 'cacheHit', 'outcome'])
+
+
+class clsEventWriter:  # Game listener writing tick events as newline delimited JSON, in batches
+    def __init__(self, stream, batchSize=64, maxDelay=0.5):
+        self.stream = stream  # Text stream, file or socket file
+        self.batchSize = batchSize  # Events buffered before writing
+        self.maxDelay = maxDelay  # Max time an event waits in the buffer (s), checked when the next event arrives
+        self.buffer = []
+        self.lastFlush = time.perf_counter()
+        self.failed = False  # Stream broke, e.g. the reader disconnected, later events are dropped
+
+    @classmethod
+    def openFile(cls, path, **kwargs):
+        return cls(open(path, 'a'), **kwargs)
+
+    @classmethod
+    def connect(cls, address, **kwargs):  # (host, port) for TCP, or a path for a Unix socket
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(address)
+        return cls(sock.makefile('w'), **kwargs)
+
+    def __call__(self, event):
+        self.buffer.append(json.dumps(event._asdict(), separators=(',', ':')) + '\n')
+        if len(self.buffer) >= self.batchSize or event.outcome is not None \
+                or time.perf_counter() - self.lastFlush >= self.maxDelay:
+            self.flush()
+
+    def flush(self):
+        if self.buffer and not self.failed:
+            try:
+                self.stream.write(''.join(self.buffer))
+                self.stream.flush()
+            except OSError as e:
+                _LOGGER.warning('Event stream failed, no more events are written: %s', e)
+                self.failed = True
+        self.buffer.clear()
+        self.lastFlush = time.perf_counter()
+
+    def close(self):
+        self.flush()
+        try:
+            self.stream.close()
+        except OSError:
+            pass  # Already reported by flush, events still in the stream's own buffer are lost
+
+
+@functools.lru_cache(maxsize=None)
+def getNeighborTable(columns, rows):  # Tuple of neighboring cells for each cell
+    table = []
+    for cell in range(columns * rows):
+        column, row = divmod(cell, rows)
+        neighbors = []
+        if row < rows - 1:
+            neighbors.append(cell + 1)
+        if row > 0:
+            neighbors.append(cell - 1)
+        if column > 0:
+            neighbors.append(cell - rows)
+        if column < columns - 1:
+            neighbors.append(cell + rows)
+        table.append(tuple(neighbors))
+    return tuple(table)
+
+
+class clsBoard:  # Mutable board of cells for depth first lookahead, moves are applied and undone in place
+    # Has the fields evaluateBoard and countFreeSpace read, so lookahead boards are evaluated in place
+    def __init__(self, snapshot, walls):
+        # Starts as generateBoard would make the snapshot's snake, walls and snake but a FREE tail. Board 0 itself
+        # can differ, its head tile is left FREE for a while after the head moved onto the tail, and from then on
+        # the snake can pass over that tile and hold it twice, so cells count the snake parts on them.
+        self.snapshot = snapshot  # Board the moves start from
+        self.columns, self.rows = snapshot.columns, snapshot.rows  # Read like a snapshot by the evaluator
+        self.freeSpaceFactor = snapshot.freeSpaceFactor
+        self.blocked = bytearray(walls)  # 1 for every cell that is not FREE, like clsBoardSnapshot
+        self.count = [0] * len(walls)  # Snake parts on each cell
+        self.snake = collections.deque(snapshot.snake)  # Snake cells, head first
+        self.snakeLength = snapshot.snakeLength
+        for cell in self.snake:
+            self.count[cell] += 1
+            self.blocked[cell] = 1
+        self.blocked[self.snake[-1]] = 0
+
+    def applyMove(self, cell):  # Move head to cell, same board as generateBoard makes, return undo record
+        changed = [cell, self.snake[-1]]  # Head and old tail, then tail parts that moved away
+        self.snake.appendleft(cell)
+        self.count[cell] += 1
+        dropped = []  # Tail cells that moved away, last first
+        while len(self.snake) > self.snakeLength:
+            tail = self.snake.pop()
+            self.count[tail] -= 1
+            dropped.append(tail)
+        changed.extend(dropped)
+        changed.append(self.snake[-1])
+        changes = [(changedCell, self.blocked[changedCell]) for changedCell in changed]  # Values before move
+        for changedCell in changed:
+            self.blocked[changedCell] = self.count[changedCell] > 0  # Walls are never under the snake
+        self.blocked[self.snake[-1]] = 0  # Mark tail as free since it is FREE for the next move
+        return dropped, changes
+
+    def undoMove(self, undo):  # Undo the last applied move
+        dropped, changes = undo
+        for cell, value in reversed(changes):
+            self.blocked[cell] = value
+        self.count[self.snake.popleft()] -= 1
+        for tail in reversed(dropped):
+            self.snake.append(tail)
+            self.count[tail] += 1
+
+    def getSnapshot(self):
+        return self.snapshot._replace(blocked=bytes(self.blocked), snake=tuple(self.snake))
+
+
+@functools.lru_cache(maxsize=None)  # Built once per board layout, shared by every game in the process
+def getCoilTable(coilNeighbors):  # Ranked corner coil moves for each cell and FREE neighbor bitmask
+    # coilNeighbors holds each cell's neighbors in corner coil priority order, see clsTile.setDirectionPriority.
+    # Bit i of the mask is set when neighbor i is FREE, the entry lists the FREE neighbors best move first.
+    return tuple(tuple(tuple(neighbor for i, neighbor in enumerate(neighbors) if mask >> i & 1)
+                       for mask in range(1 << len(neighbors)))
+                 for neighbors in coilNeighbors)
+
+
+# Compiled search kernel, see snake_kernel.c and build_kernel.py. Used when built, pure Python otherwise, and
+# both give identical results so games play the same either way. SNAKE_KERNEL=python forces pure Python.
+KERNEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'snake_kernel.dll' if sys.platform == 'win32' else 'snake_kernel.so')
+KERNEL_VERSION = 2  # Must equal KERNEL_VERSION in snake_kernel.c, older builds are not loaded
+
+
+def loadKernel():  # ctypes library of the compiled kernel, None when not built, not loadable or disabled
+    if os.environ.get('SNAKE_KERNEL', '').lower() == 'python' or not os.path.exists(KERNEL_FILE):
+        return None
+    try:
+        kernel = ctypes.CDLL(KERNEL_FILE)
+    except OSError as e:
+        _LOGGER.warning('Using pure Python search, could not load %s: %s', KERNEL_FILE, e)
+        return None
+    version = kernel.kernel_version() if hasattr(kernel, 'kernel_version') else None
+    if version != KERNEL_VERSION:
+        _LOGGER.warning('Using pure Python search, %s is version %s but snake.py needs %i, rebuild it with '
+                        'build_kernel.py', KERNEL_FILE, version, KERNEL_VERSION)
+        return None
+    cInt, cBytes, cCells = ctypes.c_int, ctypes.c_char_p, ctypes.POINTER(ctypes.c_int32)
+    kernel.evaluate_safety.argtypes = [cBytes, cInt, cInt, cInt, cInt, cInt, cCells]
+    kernel.count_free_space.argtypes = [cBytes, cInt, cInt, cInt]
+    kernel.nearest_paths.argtypes = [cBytes, cCells, cInt, cInt, cCells, cInt, cCells, cCells]
+    return kernel
+
+
+_KERNEL = loadKernel()
+
+
+def useKernel(enabled):  # Switch search backend at runtime, return True if the compiled kernel is now used
+    global _KERNEL
+    _KERNEL = loadKernel() if enabled else None
+    evaluateSafety.cache_clear()
+    return _KERNEL is not None
+
+
+def getBackend():  # Name of the search backend in use
+    return 'kernel' if _KERNEL is not None else 'python'
+
+
+def getKernelBlocked(blocked):  # Blocked cells as a kernel argument, a clsBoard bytearray is read in place
+    if isinstance(blocked, bytes):
+        return blocked
+    return (ctypes.c_char * len(blocked)).from_buffer(blocked)
+
+
+def countFreeSpace(board):  # Same count as clsFreeSpace.solve from the snake head, board is a snapshot or clsBoard
+    if _KERNEL is not None:
+        count = _KERNEL.count_free_space(getKernelBlocked(board.blocked), board.columns, board.rows, board.snake[0])
+        if count < 0:
+            raise MemoryError('Search kernel out of memory')
+        return count
+    neighborTable = getNeighborTable(board.columns, board.rows)
+    blocked = board.blocked
+    frontier = [board.snake[0]]
+    explored = set()
+    for cell in frontier:
+        for neighbor in neighborTable[cell]:
+            if not blocked[neighbor] and neighbor not in explored:
+                explored.add(neighbor)
+                frontier.append(neighbor)
+    return len(explored)
+
+
+def evaluateBoard(board):  # Same result as clsGame.checkSafety, board is a snapshot or clsBoard
+    # One flood fill from the head does both checks, SAFE as soon as the tail is reached or enough free
+    # space is counted, so a safe board rarely needs the whole region explored. Returns (safety, cells taken
+    # from the frontier).
+    blocked = board.blocked
+    head, tail = board.snake[0], board.snake[-1]
+    reqFreeSpace = int(board.snakeLength * board.freeSpaceFactor)
+    if head == tail or reqFreeSpace <= 0:
+        return SAFE, 0
+    if _KERNEL is not None:
+        nodes = ctypes.c_int32()
+        safe = _KERNEL.evaluate_safety(getKernelBlocked(blocked), board.columns, board.rows, head, tail,
+                                       reqFreeSpace, ctypes.byref(nodes))
+        if safe < 0:
+            raise MemoryError('Search kernel out of memory')
+        return SAFE if safe else NOT_SAFE, nodes.value
+    neighborTable = getNeighborTable(board.columns, board.rows)
+    frontier = [head]
+    explored = set()
+    nodes = 0
+    for cell in frontier:
+        nodes += 1
+        for neighbor in neighborTable[cell]:
+            if not blocked[neighbor] and neighbor not in explored:
+                if neighbor == tail:
+                    return SAFE, nodes
+                explored.add(neighbor)
+                if len(explored) >= reqFreeSpace:
+                    return SAFE, nodes
+                frontier.append(neighbor)
+    return NOT_SAFE, nodes
+
+
+@functools.lru_cache(maxsize=1024)
+def evaluateSafety(snapshot):  # Cached evaluateBoard of an immutable snapshot, used for boards made once per move
+    return evaluateBoard(snapshot)
+
+
 class clsTile:
-    def __init__(self, main, x, y):
+    # Slots keep tiles compact for headless games, which can run hundreds per process
+    __slots__ = ('main', 'index', 'x', 'y', 'quadrant', 'directionPriority', 'seqNeighbors',  # Fixed geometry
+                 'state',  # Tile state for each board
+                 'dist', 'prev',  # Search scratch
+                 'shapes')  # Canvas data
+
+    def __init__(self, main, index, x, y):
         self.main = main
+        self.index = index  # Tile position in main.Tiles, also its cell in board snapshots
         self.x = x  # Tile x coordinate
         self.y = y  # Tile y coordinate
         self.quadrant = None  # Tile grid quadrant
-        self.directionPriority = []  # Tile direction priority given tile location
+        self.directionPriority = ()  # Tile direction priority given tile location
         self.dist = None  # Tile distance holding variable
         self.prev = None  # Tile prev path holding variable
-        self.state = {}  # Tile state holding variable
-        for i in range(0, 10):
-            self.state[i] = FREE  # Tile state for board
+        self.state = [FREE] * main.boardCount  # Tile state for each board
         self.setDirectionPriority()  # Get direction priority list given tile location
         self.seqNeighbors = []  # Populated during finishSetup() after all tiles created
-        self.freeSpaceAfterMove = None  # Used to store free space after moving
-        self.canvas = mainApp.w  # Tile canvas object
-        self.xShape = self.x  # Tile canvas coordinate
-        self.yShape = mainApp.canvasHeight - self.y  # Canvas y and material y coord system differ
-        self.shapeCoords = {}  # Shape coordinates for shape objects
-        for sizeClass, size in [(S, 6), (M, 8), (ML, 14), (L, 18), (XL, 48)]:
-            self.shapeCoords[sizeClass] = self.xShape - 1 - size / 2, \
-                                          self.yShape - 0 - size / 2, \
-                                          self.xShape - 0 + size / 2, \
-                                          self.yShape + 1 + size / 2  # 1px offsets to center shapes
-        self.shape = {
-            HIGHLIGHT: None,
-            DEBUG_PATH_1: None,
-            DEBUG_PATH_2: None,
-            DEBUG_SPACE_1: None,
-            DEBUG_SPACE_2: None,
-            DEBUG_START: None,
-            DEBUG_END: None,
-            HEAD: None,
-            TAIL: None,
-            BODY: None,
-            FILLER_LEFT: None,
-            FILLER_TOP: None,
-            FILLER_RIGHT: None,
-            FILLER_BOTTOM: None,
-            PROJECTED_SNAKE: None,
-            FOOD: None,
-            WALL: None
-        }  # Dict of tiles shape objects on canvas
+        self.shapes = None  # Tile canvas data, None for headless games
+        if main.w is not None:
+            self.shapes = clsTileShapes(main.w, self.x, main.canvasHeight - self.y)
 
     def drawShape(self, shape):
-        self.delShape(shape)
-        if SHAPE_LIBRARY[shape]['type'] == 'filler':
-            L, B, R, T = self.shapeCoords[SHAPE_LIBRARY[shape]['size']]
-            if shape == FILLER_LEFT:
-                L -= 12  # Adjust filler shapeCoords to the left one half tile
-                R -= 12
-            elif shape == FILLER_TOP:
-                B -= 12
-                T -= 12
-            elif shape == FILLER_RIGHT:
-                L += 12
-                R += 12
-            elif shape == FILLER_BOTTOM:
-                B += 12
-                T += 12
-            self.shape[shape] = self.canvas.create_rectangle(L, B, R, T, fill=SHAPE_LIBRARY[shape]['color'],
-                                                             outline=SHAPE_LIBRARY[shape]['outlineColor'],
-                                                             width=SHAPE_LIBRARY[shape]['outlineWidth'])
-        elif SHAPE_LIBRARY[shape]['type'] == 'rectangle':
-            self.shape[shape] = self.canvas.create_rectangle(*self.shapeCoords[SHAPE_LIBRARY[shape]['size']],
-                                                             fill=SHAPE_LIBRARY[shape]['color'],
-                                                             outline=SHAPE_LIBRARY[shape]['outlineColor'],
-                                                             width=SHAPE_LIBRARY[shape]['outlineWidth'])
-        elif SHAPE_LIBRARY[shape]['type'] == 'circle':
-            self.shape[shape] = self.canvas.create_oval(*self.shapeCoords[SHAPE_LIBRARY[shape]['size']],
-                                                        fill=SHAPE_LIBRARY[shape]['color'],
-                                                        outline=SHAPE_LIBRARY[shape]['outlineColor'],
-                                                        width=SHAPE_LIBRARY[shape]['outlineWidth'])
-        elif SHAPE_LIBRARY[shape]['type'] == 'rectangleOutline':
-            self.shape[shape] = self.canvas.create_rectangle(*self.shapeCoords[SHAPE_LIBRARY[shape]['size']],
-                                                             outline=SHAPE_LIBRARY[shape]['color'],
-                                                             width=SHAPE_LIBRARY[shape]['outlineWidth'])
+        self.shapes.drawShape(shape)
 
     def delShape(self, shape):  # Delete tiles shape by given type
-        if self.shape[shape] is not None:
-            self.canvas.delete(self.shape[shape])
-            self.shape[shape] = None
+        self.shapes.delShape(shape)
 
     def getNeighborByDir(self, direction):  # Return neighbor tile by direction
         xMod, yMod = 0, 0
@@ -300,10 +615,7 @@ class clsTile:
             xMod, yMod = -GRID_SIZE, 0
         elif direction == 'R':
             xMod, yMod = GRID_SIZE, 0
-        for tile in mainApp.Tiles:
-            if (tile.x, tile.y) == (self.x + xMod, self.y + yMod):
-                return tile
-        return None
+        return self.main.tileAt.get((self.x + xMod, self.y + yMod))  # None if off the board
 
     def getSeqNeighbors(self):  # Return prioritized neighboring tile list
         neighborsList = [self.getNeighborByDir(self.directionPriority[0]),
@@ -318,48 +630,98 @@ class clsTile:
     def setDirectionPriority(self):
         if 8 * GRID_SIZE < self.x < 16 * GRID_SIZE and 8 * GRID_SIZE < self.y < 16 * GRID_SIZE:
             self.quadrant = 1   # Quadrant 1, Top Right
-            self.directionPriority = ['U', 'R', 'L', 'D']
+            self.directionPriority = ('U', 'R', 'L', 'D')
         elif 0 * GRID_SIZE < self.x < 8 * GRID_SIZE and 8 * 25 < self.y < 16 * GRID_SIZE:
             self.quadrant = 2   # Quadrant 2, Top Left
-            self.directionPriority = ['U', 'L', 'R', 'D']
+            self.directionPriority = ('U', 'L', 'R', 'D')
         elif 0 * GRID_SIZE < self.x < 8 * GRID_SIZE and 0 * GRID_SIZE < self.y < 8 * GRID_SIZE:
             self.quadrant = 3   # Quadrant 3, Bottom Left
-            self.directionPriority = ['D', 'L', 'R', 'U']
+            self.directionPriority = ('D', 'L', 'R', 'U')
         elif 8 * GRID_SIZE < self.x < 16 * GRID_SIZE and 0 * 25 < self.y < 8 * GRID_SIZE:
             self.quadrant = 4   # Quadrant 4, Bottom Right
-            self.directionPriority = ['D', 'R', 'L', 'U']
+            self.directionPriority = ('D', 'R', 'L', 'U')
 
     def flyToEndDistance(self, end):
         return math.sqrt(math.pow(self.x - end.x, 2) + math.pow(self.y - end.y, 2))
 
 
+class clsTileShapes:
+    __slots__ = ('canvas', 'shapeCoords', 'shape')
+
+    def __init__(self, canvas, xShape, yShape):  # Canvas y and material y coord system differ
+        self.canvas = canvas  # Tile canvas object
+        self.shapeCoords = {}  # Shape coordinates for shape objects
+        for sizeClass, size in [(S, 6), (M, 8), (ML, 14), (L, 18), (XL, 48)]:
+            self.shapeCoords[sizeClass] = xShape - 1 - size / 2, \
+                                          yShape - 0 - size / 2, \
+                                          xShape - 0 + size / 2, \
+                                          yShape + 1 + size / 2  # 1px offsets to center shapes
+        self.shape = {}  # Dict of tiles shape objects on canvas, only shapes currently drawn
+
+    def drawShape(self, shape):
+        self.delShape(shape)
+        if SHAPE_LIBRARY[shape]['type'] == 'filler':
+            L, B, R, T = self.shapeCoords[SHAPE_LIBRARY[shape]['size']]
+            if shape == FILLER_LEFT:
+                L -= 12  # Adjust filler shapeCoords to the left one half tile
+                R -= 12
+            elif shape == FILLER_TOP:
+                B -= 12
+                T -= 12
+            elif shape == FILLER_RIGHT:
+                L += 12
+                R += 12
+            elif shape == FILLER_BOTTOM:
+                B += 12
+                T += 12
+            self.shape[shape] = self.canvas.create_rectangle(L, B, R, T, fill=SHAPE_LIBRARY[shape]['color'],
+                                                             outline=SHAPE_LIBRARY[shape]['outlineColor'],
+                                                             width=SHAPE_LIBRARY[shape]['outlineWidth'])
+        elif SHAPE_LIBRARY[shape]['type'] == 'rectangle':
+            self.shape[shape] = self.canvas.create_rectangle(*self.shapeCoords[SHAPE_LIBRARY[shape]['size']],
+                                                             fill=SHAPE_LIBRARY[shape]['color'],
+                                                             outline=SHAPE_LIBRARY[shape]['outlineColor'],
+                                                             width=SHAPE_LIBRARY[shape]['outlineWidth'])
+        elif SHAPE_LIBRARY[shape]['type'] == 'circle':
+            self.shape[shape] = self.canvas.create_oval(*self.shapeCoords[SHAPE_LIBRARY[shape]['size']],
+                                                        fill=SHAPE_LIBRARY[shape]['color'],
+                                                        outline=SHAPE_LIBRARY[shape]['outlineColor'],
+                                                        width=SHAPE_LIBRARY[shape]['outlineWidth'])
+        elif SHAPE_LIBRARY[shape]['type'] == 'rectangleOutline':
+            self.shape[shape] = self.canvas.create_rectangle(*self.shapeCoords[SHAPE_LIBRARY[shape]['size']],
+                                                             outline=SHAPE_LIBRARY[shape]['color'],
+                                                             width=SHAPE_LIBRARY[shape]['outlineWidth'])
+
+    def delShape(self, shape):  # Delete tiles shape by given type
+        shapeId = self.shape.pop(shape, None)
+        if shapeId is not None:
+            self.canvas.delete(shapeId)
+
+
 class clsPathfind:
-    def __init__(self):
+    def __init__(self, game):
+        self.game = game  # Game whose boards are searched
         self.tile = None
         self.frontier = []  # List of tiles to explore tiles to explore next
         self.explored = []  # List of tiles already explored
         self.solution = []  # Resulting optimized path
+        self.kernelNeighbors = None  # Corner coil neighbors of each cell as a ctypes array for the kernel
 
     def solve(self, start, end, board, method):  # Pathfind from start to end using given board and method
         self.reset()
         self.frontier.append(start)
         start.dist = 0  # Initialize pathfind start distance to 0
-        if mainApp.oVisualDebug:
-            mainApp.labelBoard_text.set('%s' % board)
-        else:
-            mainApp.labelBoard_text.set('-')
-
         if method == PATH_TO_FOOD:
-            mainApp.labelAlgo_text.set('Pathfind to Food')
+            self.game.updatePathingLabels('%s' % board, 'Pathfind to Food')
         if method == PATH_TO_TAIL:
-            mainApp.labelAlgo_text.set('Pathfind to Tail')
+            self.game.updatePathingLabels('%s' % board, 'Pathfind to Tail')
 
         # Show the relevant board for visual debug
-        if mainApp.oVisualDebug:
+        if self.game.oVisualDebug:
             start.drawShape(DEBUG_START)
             end.drawShape(DEBUG_END)
             if board != 0:
-                mainApp.showProjectedBoard(board)
+                self.game.showProjectedBoard(board)
 
         # Creates a dict of board's snake's neighbors and their associated reverse snake index.
         # If any of these tiles gets explored and the path dist to the tile > rev index, then this tile
@@ -369,50 +731,51 @@ class clsPathfind:
         if method == PATH_TO_TAIL:
             willBePassedFutureTailNodes = {}
             willBePassedFutureTailNodes.clear()
-            for tile in mainApp.snake[board]:
+            for tile in self.game.snake[board]:
                 for neighbor in tile.seqNeighbors:
                     willBePassedFutureTailNodes[neighbor] = \
-                        len(mainApp.snake[board]) - mainApp.snake[board].index(tile)
+                        len(self.game.snake[board]) - self.game.snake[board].index(tile)
 
         while True:
             # If all tiles explored, return solution
             if len(self.frontier) == 0:
-                if mainApp.oVisualDebug:
-                    mainApp.deleteAllDebugVisuals()
+                if self.game.oVisualDebug:
+                    self.game.deleteAllDebugVisuals()
                 return NO_PATH, []
 
             # Sort tile list and choose first tile
             self.frontier.sort(key=lambda x: x.dist)  # Sort list in place for shortest dist first
             self.tile = self.frontier.pop(0)  # Select first tile and remove it from list
+            self.game.searchNodes += 1
 
             # If reached tail or a part of snake body that will be tail by the time head is there and method
             # is PATH_TO_TAIL then return solution
             if method == PATH_TO_TAIL and self.tile in willBePassedFutureTailNodes.values() \
                     and self.tile.dist >= willBePassedFutureTailNodes[self.tile]:
-                if mainApp.oVisualDebug:
-                    mainApp.hideProjectedBoard()
-                    mainApp.deleteAllDebugVisuals()
+                if self.game.oVisualDebug:
+                    self.game.hideProjectedBoard()
+                    self.game.deleteAllDebugVisuals()
                 raise ValueError('This never fires')
                 return PATH_TO_TAIL, self.reverseTraceSolution(start, self.tile).copy()  # Use copy of list
 
             # If reached tail then return solution
             if method == PATH_TO_TAIL and self.tile == end:
-                if mainApp.oVisualDebug:
-                    mainApp.hideProjectedBoard()
-                    mainApp.deleteAllDebugVisuals()
+                if self.game.oVisualDebug:
+                    self.game.hideProjectedBoard()
+                    self.game.deleteAllDebugVisuals()
                 return PATH_TO_TAIL, self.reverseTraceSolution(start, end).copy()  # Use copy of list
 
             # Draw visuals if they are enabled
-            if mainApp.oVisualDebug:
+            if self.game.oVisualDebug:
                 self.tile.drawShape(DEBUG_PATH_1)
-                mainApp.root.update_idletasks()
+                self.game.root.update_idletasks()
                 time.sleep(0.001)
 
             # If reached food tile and method is PATH_TO_FOOD then return solution
             if method == PATH_TO_FOOD and self.tile == end:
-                if mainApp.oVisualDebug:
-                    mainApp.hideProjectedBoard()
-                    mainApp.deleteAllDebugVisuals()
+                if self.game.oVisualDebug:
+                    self.game.hideProjectedBoard()
+                    self.game.deleteAllDebugVisuals()
                 return PATH_TO_FOOD, self.reverseTraceSolution(start, end).copy()  # Use copy of list
 
             # Explore neighbors of selected tile
@@ -420,12 +783,89 @@ class clsPathfind:
                 if neighbor not in self.explored:
                     self.frontier.append(neighbor)
                     self.explored.append(neighbor)  # No neighbor node explored twice
-                    if mainApp.oVisualDebug:
+                    if self.game.oVisualDebug:
                         neighbor.drawShape(DEBUG_PATH_2)
                     if neighbor.dist > self.tile.dist + 1:
                         neighbor.dist = self.tile.dist + 1
                         neighbor.prev = self.tile
 
+    def solveNearest(self, start, ends, board):  # Pathfind from start to every end in one search, nearest first
+        if _KERNEL is not None and not self.game.oVisualDebug:
+            return self.solveNearestKernel(start, ends, board)
+        self.reset()
+        self.frontier.append(start)
+        start.dist = 0
+        self.game.updatePathingLabels('%s' % board, 'Pathfind to Food')
+        if self.game.oVisualDebug:
+            start.drawShape(DEBUG_START)
+            for end in ends:
+                end.drawShape(DEBUG_END)
+            if board != 0:
+                self.game.showProjectedBoard(board)
+
+        # Same search as solve PATH_TO_FOOD, but an end tile does not stop the search until every end is
+        # reached, so one search orders all food by path length. Ends are FREE, so paths may pass through them.
+        remaining = set(ends)
+        paths = []
+        while self.frontier and remaining:
+            self.frontier.sort(key=lambda x: x.dist)  # Sort list in place for shortest dist first
+            self.tile = self.frontier.pop(0)  # Select first tile and remove it from list
+            self.game.searchNodes += 1
+            if self.game.oVisualDebug:
+                self.tile.drawShape(DEBUG_PATH_1)
+                self.game.root.update_idletasks()
+                time.sleep(0.001)
+
+            if self.tile in remaining:
+                remaining.discard(self.tile)
+                self.solution.clear()
+                paths.append(self.reverseTraceSolution(start, self.tile).copy())  # Use copy of list
+                if not remaining:
+                    break
+
+            for neighbor in self.tile.getFreeSeqNeighbors(board):  # Analyze FREE neighboring nodes
+                if neighbor not in self.explored:
+                    self.frontier.append(neighbor)
+                    self.explored.append(neighbor)  # No neighbor node explored twice
+                    if self.game.oVisualDebug:
+                        neighbor.drawShape(DEBUG_PATH_2)
+                    if neighbor.dist > self.tile.dist + 1:
+                        neighbor.dist = self.tile.dist + 1
+                        neighbor.prev = self.tile
+
+        if self.game.oVisualDebug:
+            self.game.hideProjectedBoard()
+            self.game.deleteAllDebugVisuals()
+        return paths
+
+    def solveNearestKernel(self, start, ends, board):  # Same paths as solveNearest, searched by the compiled kernel
+        game = self.game
+        cells = len(game.Tiles)
+        game.updatePathingLabels('%s' % board, 'Pathfind to Food')
+        if self.kernelNeighbors is None:
+            self.kernelNeighbors = (ctypes.c_int32 * (4 * cells))(
+                *[neighbor for neighbors in game.coilNeighbors for neighbor in (neighbors + (-1,) * 4)[:4]])
+        blocked = bytes(tile.state[board] != FREE for tile in game.Tiles)
+        targets = (ctypes.c_int32 * len(ends))(*[end.index for end in ends])
+        prev = (ctypes.c_int32 * cells)()
+        found = (ctypes.c_int32 * len(ends))()
+        expanded = _KERNEL.nearest_paths(blocked, self.kernelNeighbors, cells, start.index, targets, len(ends),
+                                         prev, found)
+        if expanded < 0:
+            raise MemoryError('Search kernel out of memory')
+        game.searchNodes += expanded
+        paths = []
+        for cell in found:
+            if cell < 0:
+                break
+            path = []
+            while cell != start.index:
+                path.append(game.Tiles[cell])
+                cell = prev[cell]
+            path.reverse()
+            paths.append(path)
+        return paths
+
     def reverseTraceSolution(self, start, end):
         tile = end
         while tile != start:
@@ -434,7 +874,7 @@ class clsPathfind:
         return self.solution  # First element in self.solution is first step tile, not start tile
 
     def reset(self):
-        for tile in mainApp.Tiles:  # Re-initialize all tiles.dist to large distance
+        for tile in self.game.Tiles:  # Re-initialize all tiles.dist to large distance
             tile.dist = 999
         self.frontier.clear()
         self.explored.clear()
@@ -442,7 +882,8 @@ class clsPathfind:
 
 
 class clsFreeSpace:
-    def __init__(self):
+    def __init__(self, game):
+        self.game = game  # Game whose boards are searched
         self.tile = None
         self.frontier = []  # List of tiles to explore tiles to explore next
         self.explored = []  # List of tiles already explored
@@ -451,32 +892,28 @@ class clsFreeSpace:
         self.reset()
         self.frontier.append(start)
 
-        if mainApp.oVisualDebug:
-            mainApp.labelBoard_text.set('%s' % board)
-        else:
-            mainApp.labelBoard_text.set('-')
-
-        mainApp.labelAlgo_text.set('Free Space')
+        self.game.updatePathingLabels('%s' % board, 'Free Space')
 
         # Show the relevant board for visual debug
-        if mainApp.oVisualDebug:
-            mainApp.showProjectedBoard(board)
+        if self.game.oVisualDebug:
+            self.game.showProjectedBoard(board)
 
         while True:
             # If explored all tiles, return solution
             if len(self.frontier) == 0:
-                if mainApp.oVisualDebug:
-                    mainApp.hideProjectedBoard()
-                    mainApp.deleteAllDebugVisuals()
+                if self.game.oVisualDebug:
+                    self.game.hideProjectedBoard()
+                    self.game.deleteAllDebugVisuals()
                 return len(self.explored)  # Return count of tiles explored
 
             # Select tile to explore
             self.tile = self.frontier.pop(0)  # Select first tile and remove from list
+            self.game.searchNodes += 1
 
             # Draw visuals if they are enabled
-            if mainApp.oVisualDebug:
+            if self.game.oVisualDebug:
                 self.tile.drawShape(DEBUG_SPACE_1)
-                mainApp.root.update_idletasks()
+                self.game.root.update_idletasks()
                 time.sleep(0.001)
 
             # Explore neighbors of selected tile
@@ -484,7 +921,7 @@ class clsFreeSpace:
                 if neighbor not in self.explored:
                     self.explored.append(neighbor)  # No neighbor node explored twice
                     self.frontier.append(neighbor)
-                    if mainApp.oVisualDebug:
+                    if self.game.oVisualDebug:
                         neighbor.drawShape(DEBUG_SPACE_2)
 
     def reset(self):
@@ -492,43 +929,564 @@ class clsFreeSpace:
         self.explored.clear()
 
 
-class clsMainApp:
-    def __init__(self, root):
-        print('\nRunning...')
+class clsGame:  # Headless game engine, board state and autopilot without any Tk widgets
+    def __init__(self, seed=None, policy=None, scenario=None, verbose=True):
+        self.verbose = verbose  # Print the planner's progress to stdout, listeners get tick events either way
+        self.listeners = []  # Callables given a clsTickEvent after every step, see addListener
+        self.searchNodes = 0  # Tiles expanded by searches during the current step
+        self.safetyChecks = 0  # checkSafety calls during the current step
+        self.policy = dict(DEFAULT_POLICY)  # Planner thresholds, see DEFAULT_POLICY
+        if policy is not None:
+            self.policy.update(policy)
+        checkPolicy(self.policy)
+        self.boardCount = self.policy['lookaheadDepth'] + 2  # Current board, lookahead boards and food board
+        self.foodBoard = self.boardCount - 1  # Board where snake has just eaten the food
+        self.iteration = 0  # Iteration count
+        self.oVisualDebug = False  # Frozen working copy of visualDebugSetting, only set by clsMainApp
+        self.rng = random.Random(seed)  # Games own their random sequence so many can share a process
+        self.pathfind = clsPathfind(self)
+        self.freeSpace = clsFreeSpace(self)
+        self.w = None  # Tile canvas, only set by clsMainApp
+        self.canvasWidth = 400  # Board width
+        self.canvasHeight = 400  # Board height
+        self.Tiles = []
+        self.tileAt = {}  # Dict of (x, y) tile coordinates and tiles
+        self.snakeLength = 2  # Initial snake length
+        self.snake = {}  # Dict of snakes for each board, each with list of snake tiles
+        for i in range(0, self.boardCount):  # Snake[0] = Current Board's snake list of tile objects, head first
+            self.snake[i] = []  # Snake[0][0] = Current snake head tile object
+        self.head = None
+        self.tail = None
+        self.scenario = scenario  # Walls and food from loadScenario, None for the classic empty board
+        self.foodCount = 1 if scenario is None else scenario['foodCount']  # Food items kept on the board
+        self.foods = []  # Food tiles on board 0
+        self.walls = []  # Wall tiles, placed from the scenario during finishSetup
+        self.winLength = 256  # Snake length that fills every tile that is not wall
+        self.coilNeighbors = ()  # Neighboring cells of each cell in corner coil priority order
+        self.coilTable = ()  # Ranked corner coil moves, see getCoilTable
+        self.wallMask = b''  # 1 for every wall cell, the start of every projected board
+        self.freeSpaceForEachMove = {}
+        self.outcome = None  # Game end message, set by checkGameEndConditions
+        self.message = None  # Latest move method message (label text, label color)
+        self.method = None  # Latest move method, FOOD_PATH, RECURSIVE_COIL or GUESSING_COIL
+        self.boardText = '-'  # Latest pathing board label text
+        self.algoText = '-'  # Latest pathing algorithm label text
+        self.highlightPath = []  # Latest path to food, highlighted when rendered
+        self.decisionCache = {}  # Dict of board 0 keys and their speculatively planned moves
+        self.skipRequests = []  # Lengths added by skipAhead, applied by the next step so speculation keeps them
+
+    def finishSetup(self):  # Run finishSetup after initializing game
+        self.createTiles()
+        self.setTileNeighbors()
+        if self.scenario is not None:
+            self.placeScenario()
+        self.wallMask = bytes(tile in self.walls for tile in self.Tiles)  # 1 for every wall cell
+
+    def createTiles(self):  # Create each tile object, append to Tiles
+        for i in range(13, self.canvasWidth, 25):
+            for j in range(13, self.canvasHeight, 25):
+                self.Tiles.append(clsTile(self, len(self.Tiles), i, j))
+                self.tileAt[(i, j)] = self.Tiles[-1]
+
+    def setTileNeighbors(self):  # Create a list seq neighbors for each tile
+        for tile in self.Tiles:
+            tile.seqNeighbors = tile.getSeqNeighbors()
+        self.coilNeighbors = tuple(tuple(neighbor.index for neighbor in tile.seqNeighbors) for tile in self.Tiles)
+        self.coilTable = getCoilTable(self.coilNeighbors)
+
+    def placeScenario(self):
+        columns, rows = self.canvasWidth // GRID_SIZE, self.canvasHeight // GRID_SIZE
+        if (self.scenario['columns'], self.scenario['rows']) != (columns, rows):
+            raise ValueError('Scenario %s map is %i x %i, board is %i x %i' % (
+                self.scenario['name'], self.scenario['columns'], self.scenario['rows'], columns, rows))
+        self.walls = [self.Tiles[column * rows + row] for column, row in self.scenario['walls']]
+        self.winLength = len(self.Tiles) - len(self.walls)
+
+    def initializeSnake(self):  # Init snake to random location then move
+        while True:  # Random initial starting location, away from walls and food
+            start = self.Tiles[self.rng.randint(0, len(self.Tiles) - 1)]
+            directions = [tile for tile in start.getFreeSeqNeighbors(0) if tile not in self.foods]
+            if start.state[0] == FREE and start not in self.foods and len(directions) > 0:
+                break
+        self.moveHead(start)  # Initialize snake[] with first tile
+        self.moveHead(self.rng.choice(directions))  # Move in random FREE direction
+        self.markTail()  # Mark last tile in snake[] as tail
+
+    def skipAhead(self):  # Called from the Tk thread, list append is atomic while the planner thread steps
+        self.skipRequests.append(self.policy['skipAheadLength'])
+
+    def log(self, text):
+        if self.verbose:
+            print(text)
+
+    def addListener(self, listener):  # Listener is called with a clsTickEvent after every step
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        self.listeners.remove(listener)
+
+    def messageUpdate(self, printMsg, labelMsg, labelColor):
+        self.log(printMsg)
+        self.message = labelMsg, labelColor  # Shown on label when frame is rendered
+
+    def updatePathingLabels(self, board, algo):
+        self.boardText = board if self.oVisualDebug else '-'
+        self.algoText = algo
+
+    def reset(self):
+        for i in range(0, self.boardCount):
+            self.snake[i].clear()  # Clear Snake list for all boards
+        self.snakeLength = 2
+        self.iteration = 0
+        self.outcome = None
+        self.message = None
+        self.method = None
+        self.highlightPath = []
+        self.decisionCache.clear()
+        self.skipRequests.clear()
+
+        for tile in self.Tiles:
+            for i in range(0, self.boardCount):
+                tile.state[i] = FREE
+        for tile in self.walls:
+            tile.state[0] = WALL  # Projected boards copy walls from board 0
+
+        self.foods.clear()
+        if self.scenario is not None:
+            rows = self.canvasHeight // GRID_SIZE
+            self.foods.extend(self.Tiles[column * rows + row] for column, row in self.scenario['foods'])
+        self.initializeSnake()
+        for _ in range(len(self.foods), self.foodCount):
+            self.spawnFood()  # Initial food locations
+
+    def setPosition(self, snake, foods, snakeLength):  # Put board 0 in a given position, snake tiles head first
+        for i in range(0, self.boardCount):
+            self.snake[i].clear()  # Clear Snake list for all boards
+        for tile in self.Tiles:
+            for i in range(0, self.boardCount):
+                tile.state[i] = FREE
+        for tile in self.walls:
+            tile.state[0] = WALL
+        self.snake[0].extend(snake)
+        for tile in snake:
+            tile.state[0] = SNAKE
+        self.snakeLength = snakeLength
+        self.markTail()
+        self.foods[:] = foods
+        self.outcome = None
+        self.decisionCache.clear()
+
+    def saveState(self):  # Capture board 0 as a clsGameState, see restoreState
+        return clsGameState(self.iteration, self.snakeLength, tuple(tile.index for tile in self.snake[0]),
+                            tuple(tile.index for tile in self.foods),
+                            bytes(STATE_CODES.index(tile.state[0]) for tile in self.Tiles),
+                            self.rng.getstate(), self.outcome)
+
+    def checkState(self, state):  # Raise ValueError unless the state can be restored on this game's board
+        if len(state.states) != len(self.Tiles) or any(code >= len(STATE_CODES) for code in state.states) \
+                or any((STATE_CODES[code] == WALL) != wall for code, wall in zip(state.states, self.wallMask)):
+            raise ValueError('Saved game is from a different board or scenario')
+        if any(cell >= len(self.Tiles) for cell in state.snake + state.foods):
+            raise ValueError('Saved game has cells outside the board')
+        if not 2 <= len(state.snake) <= state.snakeLength <= len(self.Tiles):
+            raise ValueError('Saved game has a snake of %i cells and length %i' % (len(state.snake), state.snakeLength))
+        # Snake cells are SNAKE or FREE, the tail is FREE and a head that moved onto the tail leaves its tile FREE
+        # for the snake to pass over again, but every SNAKE cell is part of the snake and the snake is connected
+        onSnake = set(state.snake)
+        if any(STATE_CODES[state.states[cell]] == WALL for cell in onSnake) \
+                or any(STATE_CODES[code] == SNAKE and cell not in onSnake for cell, code in enumerate(state.states)) \
+                or any(self.Tiles[cell] not in self.Tiles[nextCell].seqNeighbors
+                       for cell, nextCell in zip(state.snake, state.snake[1:])):
+            raise ValueError('Saved game has a broken snake')
+        if len(set(state.foods)) != len(state.foods) \
+                or any(STATE_CODES[state.states[cell]] != FREE or cell in onSnake for cell in state.foods):
+            raise ValueError('Saved game has food off the free tiles')
+
+    def restoreState(self, state, seed=None):  # Put board 0 back as saved, seed reseeds food for a new variation
+        self.checkState(state)
+        for i in range(0, self.boardCount):
+            self.snake[i].clear()  # Clear Snake list for all boards, projected boards are generated before use
+        for tile, code in zip(self.Tiles, state.states):
+            tile.state[0] = STATE_CODES[code]  # Board 0 exactly as saved, FREE body tiles included
+        self.snake[0].extend(self.Tiles[cell] for cell in state.snake)
+        self.foods[:] = [self.Tiles[cell] for cell in state.foods]
+        self.snakeLength = state.snakeLength
+        self.iteration = state.iteration
+        self.outcome = state.outcome
+        self.message = None
+        self.method = None
+        self.highlightPath = []
+        self.decisionCache.clear()
+        self.rng.setstate(state.rngState)
+        if seed is not None:
+            self.rng.seed(seed)
+
+    def moveHead(self, newHead):
+        self.snake[0].insert(0, newHead)  # Add new head tile to start of snake []
+        newHead.state[0] = SNAKE
+
+    def checkTail(self):
+        if len(self.snake[0]) > self.snakeLength:
+            self.snake[0][-1].state[0] = FREE
+            del self.snake[0][-1]
+            self.markTail()
+
+    def markTail(self):
+        # Tail should be drawn with tail shape, but state set to FREE state because it is valid for
+        # the head to move to the tail space because the tail will move away at same time. This also
+        # enables valid pathfinding to tail as it can only explore FREE tail tiles. Do not mark tail
+        # as FREE if snakeLength == 2 or else snake can reverse through tail, which is not valid.
+        if self.snakeLength > 2:
+            self.snake[0][-1].state[0] = FREE  # Mark tail as FREE, except when short enough to reverse
+
+    def checkFood(self):
+        if self.snake[0][0] in self.foods:
+            self.foods.remove(self.snake[0][0])
+            self.snakeLength += 1
+            self.spawnFood()
+
+    def spawnFood(self):
+        taken = set(self.snake[0])  # Don't pick FREE tail tile
+        taken.update(self.foods)
+        if not any(tile.state[0] == FREE and tile not in taken for tile in self.Tiles):
+            return  # Board is full, nothing left to spawn on
+        while True:
+            tile = self.Tiles[self.rng.randint(0, len(self.Tiles) - 1)]  # Pick a random tile in Tiles
+            if tile.state[0] == FREE and tile not in taken:
+                self.foods.append(tile)
+                break
+
+    def getFrame(self):  # Snapshot of current board 0 for rendering on the Tk thread
+        return {
+            'snake': tuple(self.snake[0]),
+            'foods': tuple(self.foods),
+            'length': self.snakeLength,
+            'highlight': self.highlightPath,
+            'message': self.message,
+            'method': self.method,
+            'board': self.boardText,
+            'algo': self.algoText,
+            'outcome': self.outcome
+        }
+
+    def getBoardSnapshot(self, board):  # Immutable copy of a board for evaluateSafety
+        return clsBoardSnapshot(self.canvasWidth // GRID_SIZE, self.canvasHeight // GRID_SIZE,
+                                bytes(tile.state[board] != FREE for tile in self.Tiles),
+                                tuple(tile.index for tile in self.snake[board]), self.snakeLength,
+                                self.policy['freeSpaceFactor'])
+
+    def checkSafety(self, board, snapshot=None):  # Snapshot or clsBoard of the board may be given if already made
+        self.safetyChecks += 1
+        if not self.oVisualDebug:  # Tile searches are only needed when they are drawn
+            if isinstance(snapshot, clsBoard):
+                safety, nodes = evaluateBoard(snapshot)  # Lookahead board, changed in place so never cached
+            else:
+                safety, nodes = evaluateSafety(snapshot if snapshot is not None else self.getBoardSnapshot(board))
+            self.searchNodes += nodes
+            self.log('[Safety Check][Board %i] - %s' % (board, safety))
+            return safety
+        # Path to tail stops as soon as the tail is found, free space always fills the whole region, so the
+        # cheaper check runs first and free space is only searched when the tail is out of reach
+        if self.checkPathToTail(board) == SAFE:
+            return SAFE
+        return self.checkFreeSpace(board)
+
+    def checkPathToTail(self, board):  # Note that tail must be marked as FREE for pathfinding
+        tailPathStatus, tailPath = self.pathfind.solve(
+            self.snake[board][0], self.snake[board][-1], board, PATH_TO_TAIL)
+        if tailPathStatus == NO_PATH:
+            self.log('[Safety Check][Check Path To Tail][Board %i] - Did Not Find Path to Tail' % board)
+            return NOT_SAFE
+        elif tailPathStatus == PATH_TO_TAIL:
+            self.log('[Safety Check][Check Path To Tail][Board %i] - Did Find Path to Tail' % board)
+            return SAFE
+        else:
+            self.log('Debug: %s' % tailPathStatus)
+            raise ValueError('Invalid Value Found Here')  # Raise error if invalid values
+
+    def checkFreeSpace(self, board):
+        # Important to have a large margin on minFreeSpace late in the game because the snake can
+        # possibly orphan off a large portion of the free space and be unable to utilize it.
+        freeSpace = self.freeSpace.solve(self.snake[board][0], board)
+        reqFreeSpace = int(self.snakeLength * self.policy['freeSpaceFactor'])
+        if freeSpace >= reqFreeSpace:
+            self.log('[Safety Check][Check Free Space][Board %i] - Enough Free Space: %i / %i'
+                       % (board, freeSpace, reqFreeSpace))
+            return SAFE
+        else:
+            self.log('[Safety Check][Check Free Space][Board %i] - Not Enough Free Space: %i / %i'
+                       % (board, freeSpace, reqFreeSpace))
+            return NOT_SAFE
+
+    def generateBoard(self, board, projectedSnake):
+        self.clearBoard(board)  # Marks every tile as FREE on board
+        for tile in self.Tiles:
+            if tile.state[0] == WALL:
+                tile.state[board] = WALL
+        for tile in projectedSnake:
+            tile.state[board] = SNAKE
+        projectedSnake[-1].state[board] = FREE  # Mark tail as free since it is FREE for current move
+
+    def clearBoard(self, board):
+        for tile in self.Tiles:
+            tile.state[board] = FREE
+
+    def getProjectedSnake(self, projectedPath, currentSnake):  # Creates projected snake from projected path
+        combinedPath = projectedPath + currentSnake
+        return combinedPath[:self.snakeLength]  # Return snakeLength elements of combined path
+
+    def checkGameEndConditions(self):
+        if len(self.snake[0]) >= self.winLength:
+            _LOGGER.debug('Win!')
+            self.outcome = 'Win!'
+
+        elif len(self.snake[0][0].getFreeSeqNeighbors(0)) == 0:
+            _LOGGER.debug('Game Over!')
+            self.outcome = 'Game Over!'
+
+    def recursivePrioritizedNeighborsCheck(self, board):
+        if board == self.policy['lookaheadDepth']:
+            return PASS, self.snake[1][0]  # Break out of recursion and return next move's head
+        freeSeqNeighbors = self.snake[board][0].getFreeSeqNeighbors(board)
+        for tile in freeSeqNeighbors:
+            self.snake[board + 1] = self.getProjectedSnake([tile], self.snake[board])
+            self.generateBoard(board + 1, self.snake[board + 1])
+            if self.checkSafety(board + 1) in [SAFE]:
+                return self.recursivePrioritizedNeighborsCheck(board + 1)
+        return FAILED, None
+
+    def recursiveCoilCheck(self):  # Same result as recursivePrioritizedNeighborsCheck(0), without touching tiles
+        # Lookahead moves are applied to one mutable board, unsafe moves are undone before the next is tried.
+        # Coil moves are looked up in the coil table by the head cell and which of its neighbors are free.
+        snapshot = self.getBoardSnapshot(0)
+        board = clsBoard(snapshot, self.wallMask)
+        blocked = snapshot.blocked  # Moves on board 0 itself, later moves on the projected boards
+        firstMove = None
+        for depth in range(1, self.policy['lookaheadDepth'] + 1):
+            head = board.snake[0]
+            mask = 0
+            for i, neighbor in enumerate(self.coilNeighbors[head]):
+                if not blocked[neighbor]:
+                    mask |= 1 << i
+            for move in self.coilTable[head][mask]:  # Best coil move first
+                undo = board.applyMove(move)
+                if self.checkSafety(depth, board) in [SAFE]:
+                    break
+                board.undoMove(undo)
+            else:
+                return FAILED, None  # No safe move on this board, like the tile search there is no backtracking
+            if firstMove is None:
+                firstMove = move
+            blocked = board.blocked
+        return PASS, self.Tiles[firstMove]
+
+    def cornerCoilByMaintainingFreeSpaceGuessing(self):
+        # Corner coil as long as guessSpaceRatio (80%) of best free space maintained
+        self.log('No Guaranteed Safe Moves Found! Proceeding by best guess anyways.')
+        if len(self.snake[0][0].getFreeSeqNeighbors(0)) == 0:
+            return None  # Game over, no more possible moves
+
+        # Look at all possible next moves and get free space remaining after each move
+        self.freeSpaceForEachMove.clear()
+        board = clsBoard(self.getBoardSnapshot(0), self.wallMask)
+        for neighbor in self.snake[0][0].getFreeSeqNeighbors(0):
+            if self.oVisualDebug:
+                self.snake[1] = self.getProjectedSnake([neighbor], self.snake[0].copy())  # Use copy of list
+                self.generateBoard(1, self.snake[1])
+                self.freeSpaceForEachMove[neighbor] = self.freeSpace.solve(self.snake[1][0], 1)
+            else:
+                undo = board.applyMove(neighbor.index)
+                self.freeSpaceForEachMove[neighbor] = countFreeSpace(board)
+                self.searchNodes += self.freeSpaceForEachMove[neighbor] + 1  # Every explored cell and the head
+                board.undoMove(undo)
+
+        # Find max free space left after best move
+        self.log('***Number of neighbors %i' % len(self.snake[0][0].seqNeighbors))
+        self.log('***Number of free neighbors %i' % len(self.snake[0][0].getFreeSeqNeighbors(0)))
+        for item in self.snake[0][0].seqNeighbors:
+            self.log('***seqNeighbor state %s' % item.state[0])
+        maxFreeSpace = max(value for key, value in self.freeSpaceForEachMove.items())
+        self.log('***Max free space: %i' % maxFreeSpace)
+
+        # Make next move based on corner coil priority as long as guessSpaceRatio of best free space is maintained
+        for tile in self.snake[0][0].getFreeSeqNeighbors(0):
+            # maxFreeSpace == 0 occurs when head chases tail closely, but move is safe
+            if maxFreeSpace == 0 or self.freeSpaceForEachMove[tile] / maxFreeSpace >= self.policy['guessSpaceRatio']:
+                return tile
+        return None
+
+    def step(self):  # Plan and commit one move on board 0 without touching the canvas, return frame
+        self.log('\n#%i' % self.iteration)
+        startTime = time.perf_counter()
+        self.searchNodes = 0
+        self.safetyChecks = 0
+        while self.skipRequests:
+            self.snakeLength += self.skipRequests.pop()
+
+        # --------- Path Planning Algo -------- #
+
+        key = self.boardKey()
+        cacheHit = key in self.decisionCache and not self.oVisualDebug
+        if cacheHit:
+            self.log('[Speculative Cache] - Hit')
+            nextMove, method, message, foodPath = self.decisionCache.pop(key)
+        else:
+            nextMove, method, message, foodPath = self.planMove()
+        self.highlightPath = foodPath
+        self.method = method
+        if nextMove is not None:
+            self.moveHead(nextMove)
+        self.messageUpdate(*message)
+
+        # --------- Core Mechanics -------- #
+
+        self.checkTail()  # Check and remove tail if needed
+        self.checkFood()  # Check if ate the food
+        self.checkGameEndConditions()  # Check for game end conditions
+
+        # --------- Events -------- #
+
+        event = None
+        if self.listeners:
+            rows = self.canvasHeight // GRID_SIZE
+            event = clsTickEvent(self.iteration, list(divmod(nextMove.index, rows)) if nextMove else None, method,
+                                 self.snakeLength, round(1000 * (time.perf_counter() - startTime), 3),
+                                 self.searchNodes, self.safetyChecks, cacheHit, self.outcome)
+        self.iteration += 1
+        if event is not None:  # Move is committed, a failing listener is logged and cannot stop the game
+            for listener in list(self.listeners):
+                try:
+                    listener(event)
+                except Exception:
+                    _LOGGER.exception('Tick listener %r failed', listener)
+        return self.getFrame()
+
+    def ticks(self):  # Generator stepping the game until it ends, yields a clsTickEvent per step
+        events = []
+        self.addListener(events.append)
+        try:
+            while self.outcome is None:
+                self.step()
+                yield events.pop()
+        finally:
+            self.removeListener(events.append)
+
+    def planMove(self):  # Decide next move on board 0, return (next head tile, method, move message, path to food)
+        # Find paths to every food, nearest first
+        self.log('[Path To Food Search] - Start')
+        foodPaths = self.pathfind.solveNearest(self.snake[0][0], self.foods, 0)
+
+        # Take the nearest food whose path is safe
+        for foodPath in foodPaths:
+
+            # Generate food board, where snake has just eaten the food
+            if self.oVisualDebug:  # Projected boards are only needed on tiles when they are drawn
+                self.snake[self.foodBoard] = self.getProjectedSnake(list(reversed(foodPath.copy())),
+                                                                    self.snake[0].copy())  # Use copy of list
+                self.generateBoard(self.foodBoard, self.snake[self.foodBoard])
+                foodBoard = None
+            else:
+                foodBoard = clsBoard(self.getBoardSnapshot(0), self.wallMask)
+                for tile in foodPath:
+                    foodBoard.applyMove(tile.index)
+                foodBoard = foodBoard.getSnapshot()
+
+            # Check if path to food is safe and make it the next move if it is
+            if self.checkSafety(self.foodBoard, foodBoard) in [SAFE]:
+                # Next tile is first tile in solution
+                return foodPath[0], FOOD_PATH, ('[Move Method] - Pathfind to Food', 'Path to Food', '#C6E0B4'), \
+                    foodPath
+        foodPath = foodPaths[0] if foodPaths else []  # Highlight path to nearest food
+
+        # If no path to food found or path is found, but not safe
+        self.log('[Recursive Search] - Start')
+        if self.oVisualDebug:  # Projected boards are only needed on tiles when they are drawn
+            recursionStatus, recursionNextMove = self.recursivePrioritizedNeighborsCheck(0)  # Pass board 0
+        else:
+            recursionStatus, recursionNextMove = self.recursiveCoilCheck()
+        if recursionStatus in [PASS]:  # Recursively check all possible next moves by priority
+            # Next snake head is the tile to move to when recursion hits break
+            self.log('[Recursive Search][Safety Check] - Passed')
+            return recursionNextMove, RECURSIVE_COIL, ('[Move Method] - Coil in Corner (Checked %i moves ahead)'
+                                                       % self.policy['lookaheadDepth'],
+                                                       'Coil in Corner - Recursive', '#FFE699'), foodPath
+
+        self.log('[Recursive Search][Safety Check] - Failed')
+        # No proven safe moves found, proceed by corner coil as long as
+        # it preserves guessSpaceRatio of possible free space
+        return self.cornerCoilByMaintainingFreeSpaceGuessing(), GUESSING_COIL, \
+            ('[Move Method] - Corner coil while preserving max space',
+             'Corner coil while preserving max space', '#FF6565'), foodPath
+
+    def boardKey(self):  # Everything on board 0 that planMove depends on
+        return tuple(self.snake[0]), tuple(self.foods), self.snakeLength, self.snake[0][-1].state[0]
+
+    def getSpeculativeMoves(self):  # Candidate moves for speculation, None is the current board itself
+        return [None] + self.snake[0][0].getFreeSeqNeighbors(0)
+
+    def speculate(self, move):  # Plan board 0 after the given move ahead of time and cache the decision
+        snake, foods, snakeLength = self.snake[0], self.foods.copy(), self.snakeLength
+        states = {tile: tile.state[0] for tile in snake}
+        rngState = self.rng.getstate()  # Food respawn is drawn from the same sequence the real move will use
+        texts = self.boardText, self.algoText
+        if move is not None:
+            states[move] = move.state[0]
+            self.snake[0] = snake.copy()
+            self.moveHead(move)
+            self.checkTail()
+            self.checkFood()
+
+        key = self.boardKey()
+        if key not in self.decisionCache and len(self.snake[0][0].getFreeSeqNeighbors(0)) > 0:
+            self.log('[Speculative Planning] - Start')
+            self.decisionCache[key] = self.planMove()
+            while len(self.decisionCache) > 64:
+                del self.decisionCache[next(iter(self.decisionCache))]  # Drop oldest decision
+
+        self.snake[0], self.foods, self.snakeLength = snake, foods, snakeLength
+        for tile, state in states.items():
+            tile.state[0] = state
+        self.rng.setstate(rngState)
+        self.boardText, self.algoText = texts
+
+
+class clsMainApp(clsGame):
+    def __init__(self, root, scenario=None, verbose=True):
+        from tkinter import Canvas, Label, Button, Frame, StringVar, N, W, S, E
+        clsGame.__init__(self, scenario=scenario, verbose=verbose)
+        self.log('\nRunning...')
         self.root = root
         self.cycleTime = 50  # Core loop time (ms)
-        self.iteration = 0  # Iteration count
         self.queueStop = False  # Queue stop request
         self.queueReset = False  # Queue reset request
         self.setPause = False  # Set pause state
-        self.oVisualDebug = False  # Frozen working copy of visualDebugSetting
         self.visualDebugSetting = False  # Toggle for turning on debugging visuals
         self.pauseForBoards = True  # Toggle for pausing when future boards displayed
         self.showCurrentBoardEveryIter = False  # Toggle to show current board at end of every iteration
+        self.backgroundPlanning = True  # Toggle for planning moves on a worker thread instead of the Tk loop
+        self.speculativePlanning = True  # Toggle for planning likely next boards during idle frame time
         self.iterationStartTime = None  # Timestamp of current iteration start
         self.mode = None
         self.messagePop = None
         self.runStatus = STOPPED
-        self.pathfind = clsPathfind()
-        self.freeSpace = clsFreeSpace()
-        self.Tiles = []
-        self.snakeLength = 2  # Initial snake length
-        self.snake = {}  # Dict of snakes for each board (0-9), each with list of snake tiles
-        for i in range(0, 10):  # Snake[0] = Current Board's snake list of tile objects, head first
-            self.snake[i] = []  # Snake[0][0] = Current snake head tile object
-        self.head = None
-        self.tail = None
-        self.food = None
-        self.freeSpaceForEachMove = {}
+        self.planner = None  # Background planner thread
+        self.plannerStop = threading.Event()  # Request for planner thread to stop after current move
+        self.frameQueue = queue.Queue(maxsize=2)  # Planned frames waiting to be rendered, current + next
+        self.renderedShapes = {}  # Dict of snake tiles and the shapes currently drawn on them
+        self.renderedFoods = set()  # Food tiles currently drawn on canvas
+        self.startState = None  # Saved game reset returns to instead of a new game, see restoreState
+        self.startSeed = None  # Food seed for startState, None keeps the saved food sequence
 
         # Window Setup
         self.root.title("Snake")
         self.root.configure(bg='white')
         self.appWidth = 800  # Overall window width
         self.appHeight = 800  # Overall window height
-        self.canvasWidth = 400  # Canvas Width
-        self.canvasHeight = 400  # Canvas Height
-        self.combinedSW = GetSystemMetrics(78)  # Combined multi-monitor width
+        try:
+            from win32api import GetSystemMetrics  # Used to detect monitor setup, Windows only
+            self.combinedSW = GetSystemMetrics(78)  # Combined multi-monitor width
+        except ImportError:
+            self.combinedSW = root.winfo_screenwidth()  # No multi-monitor detection, place as single screen
         self.sw = root.winfo_screenwidth()  # Single monitor width
         self.sh = root.winfo_screenheight()
         if self.combinedSW < 2600:
@@ -636,53 +1594,32 @@ class clsMainApp:
         self.root.update_idletasks()  # Update window geometry
 
     def finishSetup(self):  # Run finishSetup after initializing mainApp
-        self.createTiles()
-        self.setTileNeighbors()
+        clsGame.finishSetup(self)
         self.setNormalSpeed()
 
-    def createTiles(self):  # Create each tile object, append to Tiles
-        for i in range(13, self.canvasWidth, 25):
-            for j in range(13, self.canvasHeight, 25):
-                self.Tiles.append(clsTile(self, i, j))
-
-    def setTileNeighbors(self):  # Create a list seq neighbors for each tile
-        for tile in self.Tiles:
-            tile.seqNeighbors = tile.getSeqNeighbors()
-
-    def initializeSnake(self):  # Init snake to random location then move
-        start = mainApp.Tiles[random.randint(0, 255)]  # Random initial starting location
-        self.moveHead(start)  # Initialize snake[] with first tile
-        self.moveHead(random.choice(start.getFreeSeqNeighbors(0)))  # Move in random FREE direction
-        self.markTail()  # Mark last tile in snake[] as tail
-
-    def skipAhead(self):
-        self.snakeLength = self.snakeLength + 60
-
     def start(self):
         if self.runStatus == STOPPED and not self.setPause:
-            mainApp.reset()
+            if self.plannerBusy():
+                self.root.after(1, self.start)  # Wait for planner thread to finish its move
+                return
+            self.reset()
             self.runStatus = RUNNING
             self.run()
 
-    def messageUpdate(self, printMsg, labelMsg, labelColor):
-        print(printMsg)
-        self.labelMessage_text.set(labelMsg)
-        self.labelMessage.configure(bg=labelColor)
+    def updatePathingLabels(self, board, algo):
+        clsGame.updatePathingLabels(self, board, algo)
+        if self.oVisualDebug:  # Visual debug plans on the Tk thread, so labels can be updated mid search
+            self.labelBoard_text.set(self.boardText)
+            self.labelAlgo_text.set(self.algoText)
 
     def reset(self):
         self.setPause = False  # Reset buttons if they are set
         self.pauseButton.configure(bg='white')
         self.visualDebugSetting = False  # Reset buttons if they are set
         self.visualsButton.configure(bg='white')
-
-        for i in range(0, 10):
-            self.snake[i].clear()  # Clear Snake list for all boards
-        self.snakeLength = 2
-        self.iteration = 0
+        self.clearFrameQueue()
 
         for tile in self.Tiles:
-            for i in range(0, 10):
-                tile.state[i] = FREE
             tile.delShape(HIGHLIGHT)
             tile.delShape(HEAD)
             tile.delShape(BODY)
@@ -692,11 +1629,29 @@ class clsMainApp:
             tile.delShape(FILLER_TOP)
             tile.delShape(FILLER_RIGHT)
             tile.delShape(FILLER_BOTTOM)
+        self.renderedShapes.clear()
 
-        self.initializeSnake()
-        self.spawnFood()  # Initial food location
-        if mainApp.messagePop is not None:
-            mainApp.messagePop.place_forget()
+        if self.startState is not None:
+            clsGame.restoreState(self, self.startState, self.startSeed)
+        else:
+            clsGame.reset(self)
+        for tile in self.walls:
+            tile.drawShape(WALL)
+        if self.messagePop is not None:
+            self.messagePop.place_forget()
+        self.render(self.getFrame())
+
+    def restoreState(self, state, seed=None):  # Show saved game, Start and Reset return to it from now on
+        self.checkState(state)  # Restored later by reset, so a bad state is rejected here
+        self.startState = state
+        self.startSeed = seed
+        self.requestReset()
+
+    def resetWhenIdle(self):  # Reset once the planner thread is no longer touching the boards
+        if self.plannerBusy():
+            self.root.after(1, self.resetWhenIdle)
+        else:
+            self.reset()
 
     def toggleVisuals(self):
         if self.visualDebugSetting:
@@ -723,7 +1678,7 @@ class clsMainApp:
             self.queueStop = True
             self.queueReset = True
         else:
-            self.reset()
+            self.resetWhenIdle()
 
     def setFastSpeed(self):
         self.cycleTime = 10
@@ -780,225 +1735,133 @@ class clsMainApp:
             tile.delShape(DEBUG_START)
             tile.delShape(DEBUG_END)
 
-    def moveHead(self, newHead):
-        if len(self.snake[0]) > 0:
-            self.snake[0][0].delShape(HEAD)
-            self.snake[0][0].drawShape(BODY)
-        self.snake[0].insert(0, newHead)  # Add new head tile to start of snake []
-        newHead.state[0] = SNAKE
-
-        if len(self.snake[0]) > 1:
-            if newHead.x > self.snake[0][1].x:
-                newHead.drawShape(FILLER_LEFT)  # Determine which dir head came from and draw filler
-            elif newHead.x < self.snake[0][1].x:
-                newHead.drawShape(FILLER_RIGHT)
-            elif newHead.y > self.snake[0][1].y:
-                newHead.drawShape(FILLER_BOTTOM)
-            elif newHead.y < self.snake[0][1].y:
-                newHead.drawShape(FILLER_TOP)
-
-        newHead.drawShape(HEAD)  # Mark snake head color
-
-    def checkTail(self):
-        if len(self.snake[0]) > self.snakeLength:
-            self.snake[0][-1].delShape(TAIL)
-            self.snake[0][-1].state[0] = FREE
-            del self.snake[0][-1]
-            self.snake[0][-1].delShape(FILLER_LEFT)
-            self.snake[0][-1].delShape(FILLER_RIGHT)
-            self.snake[0][-1].delShape(FILLER_BOTTOM)
-            self.snake[0][-1].delShape(FILLER_TOP)
-            self.markTail()
-
-    def markTail(self):
-        # Tail should be marked with tail shape, but state set to FREE state because it is valid for
-        # the head to move to the tail space because the tail will move away at same time. This also
-        # enables valid pathfinding to tail as it can only explore FREE tail tiles. Do not mark tail
-        # as FREE if snakeLength == 2 or else snake can reverse through tail, which is not valid.
-        if self.snakeLength > 2:
-            self.snake[0][-1].state[0] = FREE  # Mark tail as FREE, except when short enough to reverse
-        self.snake[0][-1].delShape(BODY)
-        self.snake[0][-1].drawShape(TAIL)
-
-    def checkFood(self):
-        if self.snake[0][0] == self.food:
-            self.snakeLength += 1
-            self.labelSnake_text.set('%i' % self.snakeLength)
-            self.spawnFood()
-
-    def spawnFood(self):
-        while True:
-            tile = self.Tiles[random.randint(0, len(self.Tiles) - 1)]  # Pick a random tile in Tiles
-            if tile.state[0] == FREE and tile not in self.snake:  # Don't pick FREE tail tile
-                if self.food is not None:
-                    self.food.delShape(FOOD)
-                tile.drawShape(FOOD)
-                self.food = tile
-                break
-
-    def checkSafety(self, board):
-        tailSafe = self.checkPathToTail(board)
-        freeSpaceSafe = self.checkFreeSpace(board)
-        if tailSafe == SAFE or freeSpaceSafe == SAFE:
-            return SAFE
-        else:
-            return NOT_SAFE
-
-    def checkPathToTail(self, board):  # Note that tail must be marked as FREE for pathfinding
-        tailPathStatus, tailPath = self.pathfind.solve(
-            self.snake[board][0], self.snake[board][-1], board, PATH_TO_TAIL)
-        if tailPathStatus == NO_PATH:
-            print('[Safety Check][Check Path To Tail][Board %i] - Did Not Find Path to Tail' % board)
-            return NOT_SAFE
-        elif tailPathStatus == PATH_TO_TAIL:
-            print('[Safety Check][Check Path To Tail][Board %i] - Did Find Path to Tail' % board)
-            return SAFE
-        else:
-            print('Debug: %s' % tailPathStatus)
-            raise ValueError('Invalid Value Found Here')  # Raise error if invalid values
-
-    def checkFreeSpace(self, board):
-        # Important to have a large margin on minFreeSpace late in the game because the snake can
-        # possibly orphan off a large portion of the free space and be unable to utilize it.
-        freeSpace = mainApp.freeSpace.solve(self.snake[board][0], board)
-        reqFreeSpace = int(self.snakeLength * 1.5)
-        if freeSpace >= reqFreeSpace:
-            print('[Safety Check][Check Free Space][Board %i] - Enough Free Space: %i / %i'
-                  % (board, freeSpace, reqFreeSpace))
-            return SAFE
-        else:
-            print('[Safety Check][Check Free Space][Board %i] - Not Enough Free Space: %i / %i'
-                  % (board, freeSpace, reqFreeSpace))
-            return NOT_SAFE
-
-    def generateBoard(self, board, projectedSnake):
-        self.clearBoard(board)  # Marks every tile as FREE on board
-        for tile in mainApp.Tiles:
-            if tile.state[0] == WALL:
-                tile.state[board] = WALL
-        for tile in projectedSnake:
-            tile.state[board] = SNAKE
-        projectedSnake[-1].state[board] = FREE  # Mark tail as free since it is FREE for current move
-
-    def clearBoard(self, board):
-        for tile in self.Tiles:
-            tile.state[board] = FREE
-
-    @staticmethod
-    def getProjectedSnake(projectedPath, currentSnake):  # Creates projected snake from projected path
-        combinedPath = projectedPath + currentSnake
-        return combinedPath[:mainApp.snakeLength]  # Return snakeLength elements of combined path
-
-    def checkGameEndConditions(self):
-        if len(self.snake) >= 256:
-            _LOGGER.debug('Win!')
-            self.messagePop = Label(self.w, text='Win!', width=30, bg='Green', fg='white',
+    def render(self, frame):  # Draw frame on canvas, must be called from the Tk thread
+        self.renderSnake(frame['snake'])
+        foods = set(frame['foods'])
+        for tile in self.renderedFoods - foods:
+            tile.delShape(FOOD)
+        for tile in foods - self.renderedFoods:
+            tile.drawShape(FOOD)
+        self.renderedFoods = foods
+        self.highlightPathSolution(frame['highlight'])
+        self.labelSnake_text.set('%i' % frame['length'])
+        self.labelBoard_text.set(frame['board'])
+        self.labelAlgo_text.set(frame['algo'])
+        if frame['message'] is not None:
+            self.labelMessage_text.set(frame['message'][0])
+            self.labelMessage.configure(bg=frame['message'][1])
+        if frame['outcome'] is not None:
+            from tkinter import Label, CENTER
+            self.messagePop = Label(self.w, text=frame['outcome'], width=30, bg='Green', fg='white',
                                     wraplength=300, borderwidth=1, relief="solid", font=('Helvetica', 16))
             self.messagePop.place(relx=0.5, rely=0.85, anchor=CENTER)
             self.queueStop = True
 
-        if len(self.snake[0][0].getFreeSeqNeighbors(0)) == 0:
-            _LOGGER.debug('Game Over!')
-            self.messagePop = Label(self.w, text='Game Over!', width=30, bg='Green', fg='white',
-                                    wraplength=300, borderwidth=1, relief="solid", font=('Helvetica', 16))
-            self.messagePop.place(relx=0.5, rely=0.85, anchor=CENTER)
-            self.queueStop = True
-
-    def recursivePrioritizedNeighborsCheck(self, board):
-        if board == 8:
-            return PASS, self.snake[1][0]  # Break out of recursion and return next move's head
-        freeSeqNeighbors = self.snake[board][0].getFreeSeqNeighbors(board)
-        for tile in freeSeqNeighbors:
-            self.snake[board + 1] = self.getProjectedSnake([tile], self.snake[board])
-            self.generateBoard(board + 1, self.snake[board + 1])
-            if self.checkSafety(board + 1) in [SAFE]:
-                return self.recursivePrioritizedNeighborsCheck(board + 1)
-        return FAILED, None
-
-    def cornerCoilByMaintainingFreeSpaceGuessing(self):
-        # Corner coil as long as >80% of best free space maintained
-        print('No Guaranteed Safe Moves Found! Proceeding by best guess anyways.')
-        self.messageUpdate('[Move Method] - Corner coil while preserving max space',
-                           'Corner coil while preserving max space', '#FF6565')
-
-        self.checkGameEndConditions()  # Game over if no more possible moves
-
-        # Look at all possible next moves and get free space remaining after each move
-        self.freeSpaceForEachMove.clear()
-        for neighbor in self.snake[0][0].getFreeSeqNeighbors(0):
-            self.snake[1] = self.getProjectedSnake([neighbor], self.snake[0].copy())  # Use copy of list
-            self.generateBoard(1, self.snake[1])
-            self.freeSpaceForEachMove[neighbor] = self.freeSpace.solve(self.snake[1][0], 1)
-
-        # Find max free space left after best move
-        print('***Number of neighbors %i' % len(self.snake[0][0].seqNeighbors))
-        print('***Number of free neighbors %i' % len(self.snake[0][0].getFreeSeqNeighbors(0)))
-        for item in self.snake[0][0].seqNeighbors:
-            print('***seqNeighbor state %s' % item.state[0])
-        maxFreeSpace = max(value for key, value in self.freeSpaceForEachMove.items())
-        print('***Max free space: %i' % maxFreeSpace)
-
-        # Make next move based on corner coil priority as long as > 80% of best free space is maintained
-        for tile in self.snake[0][0].getFreeSeqNeighbors(0):
-            # maxFreeSpace == 0 occurs when head chases tail closely, but move is safe
-            if maxFreeSpace == 0 or self.freeSpaceForEachMove[tile] / maxFreeSpace >= 0.8:
-                self.moveHead(tile)
+    def renderSnake(self, snake):  # Redraw only snake tiles whose shapes changed since last render
+        shapes = {}
+        for i, tile in enumerate(snake):
+            if i == len(snake) - 1 and i > 0:
+                shapes[tile] = (TAIL,)
+                continue
+            tileShapes = ()
+            if i < len(snake) - 1:  # Filler towards the previous segment of the snake
+                prev = snake[i + 1]
+                if tile.x > prev.x:
+                    tileShapes = (FILLER_LEFT,)
+                elif tile.x < prev.x:
+                    tileShapes = (FILLER_RIGHT,)
+                elif tile.y > prev.y:
+                    tileShapes = (FILLER_BOTTOM,)
+                elif tile.y < prev.y:
+                    tileShapes = (FILLER_TOP,)
+            shapes[tile] = tileShapes + (HEAD if i == 0 else BODY,)
+        for tile, oldShapes in self.renderedShapes.items():
+            for shape in oldShapes:
+                if shape not in shapes.get(tile, ()):
+                    tile.delShape(shape)
+        for tile, tileShapes in shapes.items():
+            oldShapes = self.renderedShapes.get(tile, ())
+            for shape in tileShapes:
+                if shape not in oldShapes:
+                    tile.drawShape(shape)
+        self.renderedShapes = shapes
+
+    def plannerBusy(self):
+        return self.planner is not None and self.planner.is_alive()
+
+    def startPlanner(self):
+        if not self.plannerBusy():
+            self.plannerStop.clear()
+            self.planner = threading.Thread(target=self.plannerLoop, name='planner', daemon=True)
+            self.planner.start()
+
+    def stopPlanner(self):  # Planner thread finishes its current move then exits
+        self.plannerStop.set()
+
+    def plannerLoop(self):  # Planner thread, plans ahead of the Tk loop into frameQueue
+        while not self.plannerStop.is_set() and self.outcome is None:
+            frame = self.step()
+            moves = self.getSpeculativeMoves() if self.speculativePlanning and self.outcome is None else []
+            while not self.plannerStop.is_set():
+                try:
+                    if moves:
+                        self.frameQueue.put_nowait(frame)
+                    else:
+                        self.frameQueue.put(frame, timeout=0.05)  # Bounded, blocks until Tk has caught up
+                    break
+                except queue.Full:
+                    if moves:
+                        self.speculate(moves.pop(0))  # Use the wait to plan likely next boards
+
+    def clearFrameQueue(self):
+        while True:
+            try:
+                self.frameQueue.get_nowait()
+            except queue.Empty:
                 break
 
-    def run(self):
-        print('\n#%i' % self.iteration)
+    def speculateWhileIdle(self, iteration, moves, deadline):  # Tk idle callback, one candidate per call
+        if self.iteration != iteration or self.plannerBusy() or self.oVisualDebug or self.outcome is not None:
+            return  # Board has moved on since speculation was scheduled
+        if not moves or datetime.datetime.now() >= deadline:
+            return
+        self.speculate(moves[0])
+        self.root.after_idle(self.speculateWhileIdle, iteration, moves[1:], deadline)
 
+    def run(self):
         self.iterationStartTime = datetime.datetime.now()
 
-        # --------- Path Planning Algo -------- #
-
-        # Find path to food
-        print('[Path To Food Search] - Start')
-        foodPathStatus, foodPath = self.pathfind.solve(self.snake[0][0], self.food, 0, 'PathToFood')
-        self.highlightPathSolution(foodPath)
-
-        # If path to food is found
-        if foodPathStatus in [PATH_TO_FOOD]:
-
-            # Generate board, 9, where snake has just eaten the food
-            self.snake[9] = self.getProjectedSnake(list(reversed(foodPath.copy())),
-                                                   self.snake[0].copy())  # Use copy of list
-            self.generateBoard(9, self.snake[9])
-
-            # Check if path to food is safe and make it the next move if it is
-            foodPathSafety = self.checkSafety(9)
-            if foodPathSafety in [SAFE]:
-                self.moveHead(foodPath[0])  # Next tile is first tile in solution
-                self.messageUpdate('[Move Method] - Pathfind to Food', 'Path to Food', '#C6E0B4')
-
-        # If no path to food found or path is found, but not safe
-        if foodPathStatus in [NO_PATH] or foodPathSafety in [NOT_SAFE]:
-
-            print('[Recursive Search] - Start')
-            recursionStatus, recursionNextMove = self.recursivePrioritizedNeighborsCheck(0)  # Pass board 0
-            if recursionStatus in [PASS]:  # Recursively check all possible next moves by priority
-                # Next snake head is the tile to move to when recursion hits break
-                self.moveHead(recursionNextMove)
-                print('[Recursive Search][Safety Check] - Passed')
-                self.messageUpdate('[Move Method] - Coil in Corner (Checked 8 moves ahead)',
-                                   'Coil in Corner - Recursive', '#FFE699')
-            elif recursionStatus in [FAILED]:
-                print('[Recursive Search][Safety Check] - Failed')
-                # No proven safe moves found, proceed by corner coil as long as
-                # it preserves >80% possible free space
-                self.cornerCoilByMaintainingFreeSpaceGuessing()
-
-        # --------- Core Mechanics -------- #
-
-        self.checkTail()  # Check and remove tail if needed
-        self.checkFood()  # Check if ate the food
-        self.checkGameEndConditions()  # Check for game end conditions
-        self.oVisualDebug = self.visualDebugSetting  # Frozen working copy of VisualDebug switch for iter
-        iterationTime = int((datetime.datetime.now() - self.iterationStartTime).total_seconds() * 1000)
-        delay = int(self.cycleTime - iterationTime)
-        if delay < 1:
-            delay = 1  # Must be at least 1 or error
-        self.iteration += 1
+        if self.visualDebugSetting or not self.backgroundPlanning:
+            # Plan on the Tk thread so visual debug can draw the searches as they run
+            if self.plannerBusy():
+                self.stopPlanner()
+                self.root.after(1, self.run)  # Wait for planner thread to finish its move
+                return
+            self.clearFrameQueue()  # Board 0 is already ahead of any queued frames
+            self.oVisualDebug = self.visualDebugSetting  # Frozen working copy of VisualDebug switch for iter
+            frame = self.step()
+            if self.speculativePlanning and not self.oVisualDebug and self.outcome is None:
+                deadline = self.iterationStartTime + datetime.timedelta(milliseconds=self.cycleTime)
+                self.root.after_idle(self.speculateWhileIdle, self.iteration, self.getSpeculativeMoves(),
+                                     deadline)
+        else:
+            # Planner thread works on the next moves while the Tk loop only renders finished ones
+            self.oVisualDebug = False
+            if self.outcome is None:
+                self.startPlanner()
+            try:
+                frame = self.frameQueue.get_nowait()
+            except queue.Empty:
+                frame = self.getFrame() if self.outcome is not None and not self.plannerBusy() else None
+
+        if frame is not None:
+            self.render(frame)
+            iterationTime = int((datetime.datetime.now() - self.iterationStartTime).total_seconds() * 1000)
+            delay = int(self.cycleTime - iterationTime)
+            if delay < 1:
+                delay = 1  # Must be at least 1 or error
+        else:
+            delay = 1  # Planner hasn't finished the next move yet, poll again
 
         if not self.queueStop:  # Check for game stop request
             self.runStatus = RUNNING
@@ -1006,17 +1869,53 @@ class clsMainApp:
         else:
             self.queueStop = False
             self.runStatus = STOPPED
+            self.stopPlanner()
 
         if self.queueReset and self.runStatus == STOPPED:  # Check for game reset request
             self.queueReset = False
-            self.reset()
+            self.resetWhenIdle()
 
 
 # -------- Main -------- #
 
 if __name__ == '__main__':
+    import argparse
+    from tkinter import Tk
+    parser = argparse.ArgumentParser(description='Snake game with autopilot')
+    parser.add_argument('scenario', nargs='?', default=None, help='Scenario file, see scenarios/')
+    parser.add_argument('--quiet', action='store_true', help='Do not print the planner progress')
+    parser.add_argument('--state', default=None, metavar='PATH', help='Start from a game saved with packState')
+    parser.add_argument('--events', default=None, metavar='PATH', help='Append tick events to this NDJSON file')
+    parser.add_argument('--events-socket', default=None, metavar='HOST:PORT|PATH',
+                        help='Stream tick events as NDJSON to a local TCP or Unix socket')
+    args = parser.parse_args()
+
     root = Tk()
-    mainApp = clsMainApp(root)
+    mainApp = clsMainApp(root, loadScenario(args.scenario) if args.scenario else None, not args.quiet)
+    writers = []  # Event writers, closed once the window is so buffered events are written
+    if args.events:
+        writers.append(clsEventWriter.openFile(args.events))
+    if args.events_socket:
+        host, _, port = args.events_socket.rpartition(':')
+        address = (host, int(port)) if port.isdigit() else args.events_socket
+        writers.append(clsEventWriter.connect(address))
+    for writer in writers:
+        mainApp.addListener(writer)
     mainApp.finishSetup()
-    mainApp.requestReset()
-    root.mainloop()
+    if args.state:
+        with open(args.state, 'rb') as f:
+            try:
+                mainApp.restoreState(unpackState(f.read()))
+            except ValueError as e:
+                parser.error('%s: %s' % (args.state, e))
+    else:
+        mainApp.requestReset()
+    try:
+        root.mainloop()
+    finally:
+        mainApp.stopPlanner()
+        if mainApp.plannerBusy():
+            mainApp.planner.join()  # Planner finishes its current move, which may still emit an event
+        for writer in writers:
+            mainApp.removeListener(writer)
+            writer.close()
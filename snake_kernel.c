@@ -0,0 +1,180 @@
+/*
+ * Program:
+ * snake_kernel.c
+ * Snake Autopilot Search Kernel
+ *
+ * Description:
+ * Optional compiled versions of the autopilot's grid searches, loaded by snake.py through ctypes when
+ * snake_kernel.so (snake_kernel.dll on Windows) has been built with build_kernel.py. Boards are flat byte
+ * arrays with one byte per cell, 1 for every cell that is not FREE, cells numbered column * rows + row like
+ * snake.py's Tiles. Every function gives exactly the result of its pure Python twin in snake.py, so games
+ * play the same with or without the kernel. Check with: python benchmark.py --parity
+ */
+
+#include <stdint.h>
+#include <stdlib.h>
+
+#ifdef _WIN32
+#define EXPORT __declspec(dllexport)
+#else
+#define EXPORT
+#endif
+
+/* Interface version, must equal KERNEL_VERSION in snake.py. Bump both with any change to these functions so a
+ * library built from older source is not loaded. */
+#define KERNEL_VERSION 2
+
+EXPORT int kernel_version(void)
+{
+    return KERNEL_VERSION;
+}
+
+/* Flood fill from head, same as evaluateSafety. Returns 1 (SAFE) as soon as the tail is reached or
+ * reqFreeSpace cells are counted, else 0, or -1 when out of memory, and sets nodes to the cells taken from
+ * the frontier. Like the Python version the head is not marked explored up front, a FREE head tile is
+ * counted when a neighbor reaches it. */
+EXPORT int evaluate_safety(const uint8_t *blocked, int columns, int rows, int head, int tail, int reqFreeSpace,
+                           int32_t *nodes)
+{
+    int cells = columns * rows;
+    int count = 0, first = 0, last = 0, result = 0;
+    uint8_t *explored;
+    int32_t *frontier;
+
+    *nodes = 0;
+    if (head == tail || reqFreeSpace <= 0)
+        return 1;
+    explored = calloc(cells, 1);
+    frontier = malloc((cells + 1) * sizeof(int32_t));
+    if (explored == NULL || frontier == NULL) {
+        free(explored);
+        free(frontier);
+        return -1;
+    }
+    frontier[last++] = head;
+    while (first < last && !result) {
+        int cell = frontier[first++];
+        int column = cell / rows, row = cell % rows;
+        int neighbors[4], n = 0, i;
+        (*nodes)++;
+        if (row < rows - 1)
+            neighbors[n++] = cell + 1;
+        if (row > 0)
+            neighbors[n++] = cell - 1;
+        if (column > 0)
+            neighbors[n++] = cell - rows;
+        if (column < columns - 1)
+            neighbors[n++] = cell + rows;
+        for (i = 0; i < n; i++) {
+            int neighbor = neighbors[i];
+            if (blocked[neighbor] || explored[neighbor])
+                continue;
+            if (neighbor == tail || ++count >= reqFreeSpace) {
+                result = 1;
+                break;
+            }
+            explored[neighbor] = 1;
+            frontier[last++] = neighbor;
+        }
+    }
+    free(explored);
+    free(frontier);
+    return result;
+}
+
+/* Size of the contiguous free space reached from start, same count as countFreeSpace, or -1 when out of
+ * memory. */
+EXPORT int count_free_space(const uint8_t *blocked, int columns, int rows, int start)
+{
+    int cells = columns * rows;
+    int count = 0, first = 0, last = 0;
+    uint8_t *explored = calloc(cells, 1);
+    int32_t *frontier = malloc((cells + 1) * sizeof(int32_t));
+
+    if (explored == NULL || frontier == NULL) {
+        free(explored);
+        free(frontier);
+        return -1;
+    }
+    frontier[last++] = start;
+    while (first < last) {
+        int cell = frontier[first++];
+        int column = cell / rows, row = cell % rows;
+        int neighbors[4], n = 0, i;
+        if (row < rows - 1)
+            neighbors[n++] = cell + 1;
+        if (row > 0)
+            neighbors[n++] = cell - 1;
+        if (column > 0)
+            neighbors[n++] = cell - rows;
+        if (column < columns - 1)
+            neighbors[n++] = cell + rows;
+        for (i = 0; i < n; i++) {
+            int neighbor = neighbors[i];
+            if (!blocked[neighbor] && !explored[neighbor]) {
+                explored[neighbor] = 1;
+                frontier[last++] = neighbor;
+                count++;
+            }
+        }
+    }
+    free(explored);
+    free(frontier);
+    return count;
+}
+
+/* Breadth first search from start to every target, same search as clsPathfind.solveNearest. neighbors holds
+ * 4 cells per cell in corner coil priority order, -1 where there is none. prev receives each reached cell's
+ * previous cell, found receives the targets in the order they are reached followed by -1. Returns the number
+ * of cells taken from the frontier, or -1 when out of memory. */
+EXPORT int nearest_paths(const uint8_t *blocked, const int32_t *neighbors, int cells, int start,
+                         const int32_t *targets, int targetCount, int32_t *prev, int32_t *found)
+{
+    int expanded = 0, first = 0, last = 0, foundCount = 0, remaining = 0, i;
+    uint8_t *explored = calloc(cells, 1);
+    uint8_t *isTarget = calloc(cells, 1);
+    int32_t *frontier = malloc((cells + 1) * sizeof(int32_t));
+
+    if (explored == NULL || isTarget == NULL || frontier == NULL) {
+        free(explored);
+        free(isTarget);
+        free(frontier);
+        return -1;
+    }
+    for (i = 0; i < targetCount; i++) {
+        found[i] = -1;
+        if (!isTarget[targets[i]]) {
+            isTarget[targets[i]] = 1;
+            remaining++;
+        }
+    }
+    frontier[last++] = start;
+    while (first < last && remaining > 0) {
+        int cell = frontier[first++];
+        expanded++;
+        if (isTarget[cell]) {
+            isTarget[cell] = 0;
+            found[foundCount++] = cell;
+            if (--remaining == 0)
+                break;
+        }
+        for (i = 0; i < 4; i++) {
+            int neighbor = neighbors[4 * cell + i];
+            if (neighbor < 0 || blocked[neighbor] || explored[neighbor])
+                continue;
+            explored[neighbor] = 1;
+            if (neighbor == start) {
+                /* A FREE start tile found again sorts to the front of the Python frontier with distance 0
+                 * and is taken next, adding nothing since its neighbors are all explored */
+                expanded++;
+                continue;
+            }
+            prev[neighbor] = cell;
+            frontier[last++] = neighbor;
+        }
+    }
+    free(explored);
+    free(isTarget);
+    free(frontier);
+    return expanded;
+}
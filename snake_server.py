@@ -0,0 +1,315 @@
+# Program:
+# snake_server.py
+# Snake Autopilot Session Server
+#
+# Description:
+# This python program hosts many headless autopilot games (clsGame from snake.py) in one process and serves
+# them to local clients such as dashboards and test harnesses. Clients connect over a local TCP or Unix
+# socket and talk newline-delimited JSON, one object per line. Every session ticks on its own schedule in
+# the asyncio loop while the planning for each move, which is where the checkSafety searches run, is
+# offloaded to a thread pool executor so the loop stays responsive. Subscribers get a full snapshot when
+# they subscribe followed by a small delta per tick.
+#
+# Requests (optional 'id' is echoed back in the reply):
+# - {"op": "create", "seed": 1, "cycleTime": 50, "subscribe": true}  -> {"ok": true, "session": 1}
+#   Optional "scenario": "scenarios/rooms.json" plays a scenario map with walls and several food items
+# - {"op": "subscribe", "session": 1} / {"op": "unsubscribe", "session": 1}
+# - {"op": "pause", "session": 1} / {"op": "resume", "session": 1}
+# - {"op": "reset", "session": 1} / {"op": "close", "session": 1}
+# - {"op": "list"}
+# Sessions are closed when the client that created them disconnects.
+#
+# Events:
+# - {"event": "snapshot", "session": 1, "iteration": 0, "snake": [[x, y], ...], "foods": [[x, y]], "walls": [], ...}
+# - {"event": "tick", "session": 1, "iteration": 5, "head": [x, y], "removed": [[x, y]], "length": 3, ...}
+#   "method" is the move method from snake.py, "foodPath", "recursiveCoil" or "guessingCoil"
+#   Ticks only carry "foods" when the food changed
+# - {"event": "overflow"} when a client falls too far behind, followed by fresh snapshots
+# - {"event": "error", "session": 1, "error": "..."} when a step or reset fails, the session waits for a reset
+#
+# Cells are [column, row] grid coordinates with [0, 0] in the bottom left corner.
+
+
+# -------- Imports -------- #
+import asyncio
+import argparse
+import itertools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import snake
+
+CLIENT_QUEUE_SIZE = 256  # Max events waiting to be written to a client before it is resynced
+
+# Logger
+_LOGGER = logging.getLogger(__name__)
+
+
+def getCell(tile):  # Grid [column, row] of a tile
+    return [tile.x // snake.GRID_SIZE, tile.y // snake.GRID_SIZE]
+
+
+class clsClient:
+    def __init__(self, writer):
+        self.writer = writer
+        self.outbox = asyncio.Queue()  # Messages waiting to be written, replies and events
+        self.events = 0  # Events in outbox, limited to CLIENT_QUEUE_SIZE
+        self.sessions = set()  # Sessions this client is subscribed to
+        self.task = asyncio.ensure_future(self.writeLoop())
+
+    def reply(self, message):  # Replies are never dropped, a client only gets as many as it sent requests
+        self.outbox.put_nowait(message)
+
+    def send(self, event):  # Never blocks, a client too slow to keep up is dropped back to snapshots
+        if self.events < CLIENT_QUEUE_SIZE:
+            self.events += 1
+            self.outbox.put_nowait(event)
+            return
+        replies = []
+        while not self.outbox.empty():
+            message = self.outbox.get_nowait()
+            if 'event' not in message:
+                replies.append(message)  # Kept, in order, ahead of the overflow marker
+        self.events = 0
+        for message in replies:
+            self.reply(message)
+        self.send({'event': 'overflow'})
+        for session in self.sessions:
+            if self.events >= CLIENT_QUEUE_SIZE:
+                break
+            self.send(session.getSnapshot())
+
+    async def writeLoop(self):
+        try:
+            while True:
+                message = await self.outbox.get()
+                if 'event' in message:
+                    self.events -= 1
+                self.writer.write((json.dumps(message, separators=(',', ':')) + '\n').encode())
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def close(self):
+        for session in list(self.sessions):
+            session.unsubscribe(self)
+        self.task.cancel()
+        self.writer.close()
+
+
+class clsSession:
+    def __init__(self, server, sessionId, seed, cycleTime, scenario=None, owner=None):
+        self.server = server
+        self.id = sessionId
+        self.owner = owner  # Client that created the session, closing it closes the session
+        self.error = None  # Message of the last failed step or reset, cleared by a good reset
+        self.cycleTime = cycleTime  # Tick interval (ms)
+        self.game = snake.clsGame(seed, scenario=scenario, verbose=server.verbose)
+        self.game.finishSetup()
+        self.game.reset()
+        self.subscribers = set()
+        self.resumed = asyncio.Event()  # Cleared while paused
+        self.resumed.set()
+        self.queueReset = False  # Reset request, applied between moves
+        self.closed = False
+        self.prevCells = [getCell(tile) for tile in self.game.snake[0]]
+        self.prevFoods = tuple(self.game.foods)
+        self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        nextTick = loop.time()
+        while not self.closed:
+            await self.resumed.wait()
+            try:
+                if self.queueReset:
+                    self.queueReset = False
+                    await loop.run_in_executor(self.server.executor, self.game.reset)
+                    self.error = None
+                    self.publishSnapshot()
+                if self.game.outcome is not None or self.error is not None:
+                    self.resumed.clear()  # Game ended or failed, wait for a reset
+                    continue
+                frame = await loop.run_in_executor(self.server.executor, self.game.step)
+            except Exception as e:
+                _LOGGER.exception('Session %i failed', self.id)
+                self.error = '%s: %s' % (type(e).__name__, e)
+                self.publish({'event': 'error', 'session': self.id, 'error': self.error})
+                continue
+            if self.closed:
+                break
+            self.publish(self.getDelta(frame))
+
+            # Sleep until next tick, dropping missed ticks instead of bursting to catch up
+            nextTick += self.cycleTime / 1000
+            now = loop.time()
+            if nextTick < now:
+                nextTick = now
+            await asyncio.sleep(nextTick - now)
+
+    def getDelta(self, frame):
+        cells = [getCell(tile) for tile in frame['snake']]
+        occupied = {tuple(cell) for cell in cells}
+        delta = {
+            'event': 'tick',
+            'session': self.id,
+            'iteration': self.game.iteration,
+            'head': cells[0],
+            'removed': [cell for cell in self.prevCells if tuple(cell) not in occupied],
+            'length': frame['length'],
+            'method': frame['method']
+        }
+        if frame['foods'] != self.prevFoods:
+            delta['foods'] = [getCell(tile) for tile in frame['foods']]
+        if frame['outcome'] is not None:
+            delta['outcome'] = frame['outcome']
+        self.prevCells = cells
+        self.prevFoods = frame['foods']
+        return delta
+
+    def getSnapshot(self):
+        return {
+            'event': 'snapshot',
+            'session': self.id,
+            'iteration': self.game.iteration,
+            'snake': [getCell(tile) for tile in self.game.snake[0]],
+            'foods': [getCell(tile) for tile in self.game.foods],
+            'walls': [getCell(tile) for tile in self.game.walls],
+            'length': self.game.snakeLength,
+            'outcome': self.game.outcome,
+            'paused': not self.resumed.is_set()
+        }
+
+    def publish(self, message):
+        for client in self.subscribers:
+            client.send(message)
+
+    def publishSnapshot(self):
+        self.prevCells = [getCell(tile) for tile in self.game.snake[0]]
+        self.prevFoods = tuple(self.game.foods)
+        self.publish(self.getSnapshot())
+
+    def subscribe(self, client):
+        self.subscribers.add(client)
+        client.sessions.add(self)
+        client.send(self.getSnapshot())
+
+    def unsubscribe(self, client):
+        self.subscribers.discard(client)
+        client.sessions.discard(self)
+
+    def reset(self):
+        self.queueReset = True
+        self.resumed.set()
+
+    def close(self):
+        self.closed = True
+        self.resumed.set()
+        for client in list(self.subscribers):
+            self.unsubscribe(client)
+
+
+class clsServer:
+    def __init__(self, workers=None, verbose=False):
+        self.verbose = verbose  # Keep the per move planner prints
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='planner')
+        self.sessions = {}  # Dict of session id and session
+        self.sessionIds = itertools.count(1)
+
+    async def handleClient(self, reader, writer):
+        client = clsClient(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    request, reply = {}, {'ok': False, 'error': 'Bad JSON: %s' % e}
+                else:
+                    reply = self.tryRequest(client, request)
+                if isinstance(request, dict) and 'id' in request:
+                    reply['id'] = request['id']
+                client.reply(reply)
+        except ConnectionError:
+            pass
+        finally:
+            for session in [session for session in self.sessions.values() if session.owner is client]:
+                session.close()
+                del self.sessions[session.id]
+            client.close()
+
+    def tryRequest(self, client, request):  # Reply to a parsed request, errors become error replies
+        if not isinstance(request, dict):
+            return {'ok': False, 'error': 'Request must be a JSON object'}
+        try:
+            return self.handleRequest(client, request)
+        except KeyError as e:
+            return {'ok': False, 'op': request.get('op'), 'error': 'missing %s' % e}
+        except (ValueError, TypeError, OSError) as e:
+            return {'ok': False, 'op': request.get('op'), 'error': str(e)}
+
+    def handleRequest(self, client, request):
+        op = request['op']
+        if op == 'create':
+            scenario = snake.loadScenario(request['scenario']) if 'scenario' in request else None
+            session = clsSession(self, next(self.sessionIds), request.get('seed'),
+                                 int(request.get('cycleTime', 50)), scenario, client)
+            self.sessions[session.id] = session
+            if request.get('subscribe', False):
+                session.subscribe(client)
+            return {'ok': True, 'op': op, 'session': session.id}
+        if op == 'list':
+            return {'ok': True, 'op': op, 'sessions': [
+                {'session': session.id, 'iteration': session.game.iteration, 'length': session.game.snakeLength,
+                 'outcome': session.game.outcome, 'error': session.error, 'subscribers': len(session.subscribers)}
+                for session in self.sessions.values()]}
+
+        session = self.sessions.get(request['session'])
+        if session is None:
+            return {'ok': False, 'op': op, 'error': 'No session %s' % request['session']}
+        if op == 'subscribe':
+            session.subscribe(client)
+        elif op == 'unsubscribe':
+            session.unsubscribe(client)
+        elif op == 'pause':
+            session.resumed.clear()
+        elif op == 'resume':
+            session.resumed.set()
+        elif op == 'reset':
+            session.reset()
+        elif op == 'close':
+            session.close()
+            del self.sessions[session.id]
+        else:
+            return {'ok': False, 'op': op, 'error': 'Unknown op %s' % op}
+        return {'ok': True, 'op': op, 'session': session.id}
+
+    async def serve(self, host, port, unixPath=None):
+        if unixPath is not None:
+            server = await asyncio.start_unix_server(self.handleClient, path=unixPath)
+            _LOGGER.info('Serving on %s', unixPath)
+        else:
+            server = await asyncio.start_server(self.handleClient, host, port)
+            _LOGGER.info('Serving on %s:%i', host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# -------- Main -------- #
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve headless snake autopilot sessions to local clients')
+    parser.add_argument('--host', default='127.0.0.1', help='Local address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix', default=None, help='Unix socket path to listen on instead of TCP')
+    parser.add_argument('--workers', type=int, default=None, help='Planner executor threads')
+    parser.add_argument('--verbose', action='store_true', help='Keep the per move planner prints')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(clsServer(args.workers, args.verbose).serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
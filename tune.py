@@ -0,0 +1,169 @@
+# Program:
+# tune.py
+# Snake Autopilot Policy Tuner
+#
+# Description:
+# This python program sweeps the planner policy (DEFAULT_POLICY in snake.py) by playing seeded headless games
+# in parallel worker processes. Every candidate policy plays the same seeds, and is reported by win rate,
+# mean final snake length and mean decision time per move. The recommendation is the cheapest policy, by
+# mean decision time, whose win rate and mean length stay within the given margins of the best policy.
+#
+# Search:
+# - grid:    Every policy in the grid plays --games seeds
+# - halving: Successive halving. Every policy plays --games seeds, the best 1/eta move on to eta times as
+#            many seeds, and so on until one policy is left or --max-games is reached
+#
+# Usage:
+# - python tune.py --grid freeSpaceFactor=1.0,1.25,1.5 lookaheadDepth=4,8 --games 8
+# - python tune.py --search halving --grid guessSpaceRatio=0.6,0.7,0.8,0.9 --games 4 --max-games 32
+# - python tune.py --grid freeSpaceFactor=1.0,1.5 --scenario scenarios/pillars.json
+
+
+# -------- Imports -------- #
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import time
+import snake
+
+
+def playGame(job):  # Play one seeded game with the given policy, run in a worker process
+    policy, seed, maxIterations, scenario = job
+    game = snake.clsGame(seed, policy, scenario, verbose=False)
+    planningTime = 0
+    game.finishSetup()
+    game.reset()
+    while game.outcome is None and (maxIterations is None or game.iteration < maxIterations):
+        start = time.perf_counter()
+        game.step()
+        planningTime += time.perf_counter() - start
+    return {'policy': policy, 'seed': seed, 'win': game.outcome == 'Win!', 'length': game.snakeLength,
+            'iterations': game.iteration, 'planningTime': planningTime}
+
+
+def parseGrid(items):  # ['name=1,2', ...] to list of policy dicts, bad values exit before any game is played
+    axes = []
+    for item in items:
+        name, _, values = item.partition('=')
+        if name not in snake.DEFAULT_POLICY:
+            raise SystemExit('Unknown policy setting %s, expected one of %s'
+                             % (name, ', '.join(snake.DEFAULT_POLICY)))
+        valueType = type(snake.DEFAULT_POLICY[name])
+        axis = []
+        for text in values.split(','):
+            try:
+                value = valueType(text)
+                snake.checkPolicy(dict(snake.DEFAULT_POLICY, **{name: value}))
+            except ValueError as e:
+                raise SystemExit('Bad grid value %s=%s: %s' % (name, text, e))
+            axis.append((name, value))
+        axes.append(axis)
+    return [dict(combination) for combination in itertools.product(*axes)]
+
+
+def getKey(policy):
+    return json.dumps(policy, sort_keys=True)
+
+
+def getLabel(policy):  # Short name listing only the settings that differ from DEFAULT_POLICY
+    return ' '.join('%s=%s' % (name, value) for name, value in sorted(policy.items())
+                    if value != snake.DEFAULT_POLICY[name]) or 'default'
+
+
+class clsTuner:
+    def __init__(self, workers, maxIterations, scenario=None):
+        self.pool = multiprocessing.Pool(workers)
+        self.maxIterations = maxIterations
+        self.scenario = scenario  # Scenario every game plays, None for the classic board
+        self.results = {}  # Dict of policy key and list of game results
+
+    def play(self, policies, games):  # Make sure every policy has played seeds 0 to games - 1
+        jobs = []
+        for policy in policies:
+            played = len(self.results.setdefault(getKey(policy), []))
+            jobs.extend((policy, seed, self.maxIterations, self.scenario) for seed in range(played, games))
+        for result in self.pool.imap_unordered(playGame, jobs):
+            self.results[getKey(result['policy'])].append(result)
+            print('.', end='', flush=True)
+        print()
+
+    def getStats(self, policy):
+        results = self.results[getKey(policy)]
+        iterations = sum(result['iterations'] for result in results)
+        return {
+            'policy': policy,
+            'games': len(results),
+            'winRate': sum(result['win'] for result in results) / len(results),
+            'meanLength': sum(result['length'] for result in results) / len(results),
+            'decisionMs': 1000 * sum(result['planningTime'] for result in results) / max(iterations, 1)
+        }
+
+    def rank(self, policies):  # Best first, by win rate then mean length
+        return sorted(policies, key=lambda policy: (self.getStats(policy)['winRate'],
+                                                    self.getStats(policy)['meanLength']), reverse=True)
+
+    def gridSearch(self, policies, games):
+        self.play(policies, games)
+        return policies
+
+    def halvingSearch(self, policies, games, eta, maxGames):
+        while True:
+            self.play(policies, games)
+            if len(policies) == 1 or games * eta > maxGames:
+                return policies
+            policies = self.rank(policies)[:max(1, math.ceil(len(policies) / eta))]
+            games *= eta
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+def report(stats, finalists, winMargin, lengthMargin):  # Print table, return recommended finalist stats
+    print('%-50s %6s %8s %10s %12s' % ('Policy', 'Games', 'Win rate', 'Mean len', 'Decision ms'))
+    for stat in stats:
+        print('%-50s %6i %7.0f%% %10.1f %12.3f' % (getLabel(stat['policy']), stat['games'], 100 * stat['winRate'],
+                                                   stat['meanLength'], stat['decisionMs']))
+    finalistStats = [stat for stat in stats if stat['policy'] in finalists]
+    best = finalistStats[0]
+    acceptable = [stat for stat in finalistStats if stat['winRate'] >= best['winRate'] - winMargin
+                  and stat['meanLength'] >= best['meanLength'] * (1 - lengthMargin)]
+    return min(acceptable, key=lambda stat: stat['decisionMs'])
+
+
+# -------- Main -------- #
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep snake planner policy settings over headless games')
+    parser.add_argument('--grid', nargs='+', default=[], metavar='NAME=V1,V2',
+                        help='Policy values to sweep, settings left out keep their defaults')
+    parser.add_argument('--search', choices=['grid', 'halving'], default='grid', help='Search strategy')
+    parser.add_argument('--games', type=int, default=8, help='Seeds per policy, or per policy in first round')
+    parser.add_argument('--eta', type=int, default=2, help='Successive halving keep 1/eta, eta times the games')
+    parser.add_argument('--max-games', type=int, default=64, help='Successive halving max seeds per policy')
+    parser.add_argument('--max-iterations', type=int, default=None, help='Stop each game after this many moves')
+    parser.add_argument('--scenario', default=None, help='Scenario file to play instead of the classic board')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, defaults to cpu count')
+    parser.add_argument('--win-margin', type=float, default=0.05,
+                        help='Recommended policy may lose this much win rate against the best')
+    parser.add_argument('--length-margin', type=float, default=0.1,
+                        help='Recommended policy may lose this fraction of mean length against the best')
+    args = parser.parse_args()
+
+    candidates = [dict(snake.DEFAULT_POLICY, **policy) for policy in parseGrid(args.grid)]
+    scenario = snake.loadScenario(args.scenario) if args.scenario else None
+    tuner = clsTuner(args.workers, args.max_iterations, scenario)
+    try:
+        if args.search == 'grid':
+            finalists = tuner.gridSearch(candidates, args.games)
+        else:
+            finalists = tuner.halvingSearch(candidates, args.games, args.eta, args.max_games)
+    finally:
+        tuner.close()
+
+    ranked = tuner.rank([policy for policy in candidates if getKey(policy) in tuner.results])
+    allStats = [tuner.getStats(policy) for policy in ranked]
+    recommended = report(allStats, finalists, args.win_margin, args.length_margin)
+    print('\nRecommended: %s' % getKey(recommended['policy']))